@@ -0,0 +1,156 @@
+"""
+Benchmarks des chemins de calcul et d'export sur classeurs synthétiques.
+
+    python -m benchmarks.run_benchmarks --apartments 10,100 --periods 12,60 --frais-rows 100,5000
+    python -m benchmarks.run_benchmarks --save-baseline      # enregistre benchmarks/baseline.json (propre à la machine, non versionné)
+    python -m benchmarks.run_benchmarks --tolerance 0.25     # code retour 1 si régression > 25 % vs baseline
+
+Chaque cas tourne dans un processus neuf (mesure de RSS crête propre, pas de cache chaud) et rapporte:
+temps mural, RSS crête, parses de feuilles (WorkbookSnapshot) et ouvertures de classeurs openpyxl.
+Les résultats (benchmarks/results/) et la baseline restent locaux: ils ne sont comparables que sur une même machine.
+"""
+from pathlib import Path
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+
+HERE = Path(__file__).resolve().parent
+BASELINE = HERE / "baseline.json"
+RESULTS = HERE / "results"
+
+CASES = ("build_repartitions", "preview_tables", "export_invoices_pdf", "export_invoices_xlsx", "export_log", "regrouper_frais")
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024*1024 if sys.platform == "darwin" else 1024), 1)
+
+def _engine(workdir: Path, si_path: Path):
+    from src.config_loader import ConfigManager
+    from src.app_logic import CalculationEngine
+    cfg = ConfigManager(workdir / "app", watch_interval=0)
+    with cfg.batch():
+        cfg.save_user_setting("si_path", str(si_path)); cfg.save_user_setting("cache_enabled", False)
+    return CalculationEngine(cfg)
+
+def _run_case(case: str, files: dict, workdir: str) -> dict:
+    """Exécuté dans un processus dédié: prépare le cas, puis mesure uniquement l'appel ciblé."""
+    import openpyxl
+    from src.file_io import WorkbookSnapshot
+    loads = [0]; load_workbook = openpyxl.load_workbook
+    def _counting(*a, **k):
+        loads[0] += 1
+        return load_workbook(*a, **k)
+    openpyxl.load_workbook = _counting
+    workdir = Path(workdir); out_dir = workdir / "out"
+    if case == "regrouper_frais":
+        import shutil
+        from src import frais_excel
+        target = workdir / "frais_run.xlsx"; shutil.copy(files["frais"], target)
+        frais_excel.EXCEL_PATH = str(target)
+        fn = frais_excel.regrouper_frais_vers_frais_divers
+    else:
+        eng = _engine(workdir, files["si"])
+        if case == "build_repartitions":
+            fn = lambda: eng.build_repartitions(files["charges"], None)
+        elif case == "preview_tables":
+            fn = lambda: eng.preview_tables(files["charges"], None)
+        else:
+            rep_df = eng.build_repartitions(files["charges"], None)[0]
+            fn = {"export_invoices_pdf": lambda: eng.export_invoices_pdf(out_dir, "2025-12", rep_df, None, workers=1),
+                  "export_invoices_xlsx": lambda: eng.export_invoices_xlsx(out_dir, "2025-12", rep_df, None, workers=1),
+                  "export_log": lambda: eng.export_log(out_dir, "2025-12", rep_df)}[case]
+    WorkbookSnapshot.parse_calls = 0; loads[0] = 0
+    t0 = time.perf_counter()
+    try:
+        fn(); error = None
+    except ImportError as e:
+        error = f"ignoré: {e}"
+    wall = time.perf_counter() - t0
+    return {"wall_s": round(wall, 4), "peak_rss_mb": _peak_rss_mb(), "sheet_parses": WorkbookSnapshot.parse_calls,
+            "workbook_loads": loads[0], "error": error}
+
+def run(apartments: list, periods: list, frais_rows: list, frais_sheets: int, cases: list) -> list:
+    from benchmarks import synthetic
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="perplexity_bench_") as tmp:
+        tmp = Path(tmp)
+        for n_apt, n_per, n_rows in itertools.product(apartments, periods, frais_rows):
+            params = {"apartments": n_apt, "periods": n_per, "frais_rows": n_rows, "frais_sheets": frais_sheets}
+            tag = f"a{n_apt}_p{n_per}_r{n_rows}"
+            files = {"charges": synthetic.make_charges(tmp / f"charges_{tag}.xlsx", n_apt, n_per),
+                     "si": synthetic.make_si(tmp / f"si_{tag}.xlsx", n_per),
+                     "frais": synthetic.make_frais(tmp / f"frais_{tag}.xlsx", frais_sheets, n_rows)}
+            for case in cases:
+                workdir = tmp / f"{case}_{tag}"; workdir.mkdir()
+                with ctx.Pool(1) as pool:
+                    res = pool.apply(_run_case, (case, files, str(workdir)))
+                results.append({"case": case, "key": f"{case}[{tag}]", **params, **res})
+                print(f"  {case:<22} {tag:<18} {res['wall_s']:>9.3f} s", file=sys.stderr)
+    return results
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    base = {r["key"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base.get(r["key"])
+        if not b or r.get("error") or b.get("error"): continue
+        r["baseline_wall_s"] = b["wall_s"]
+        if b["wall_s"] > 0 and r["wall_s"] > b["wall_s"] * (1 + tolerance):
+            regressions.append(r)
+        if r["sheet_parses"] > b.get("sheet_parses", r["sheet_parses"]) or r["workbook_loads"] > b.get("workbook_loads", r["workbook_loads"]):
+            if r not in regressions: regressions.append(r)
+    return regressions
+
+def summary_table(results: list) -> str:
+    head = f"{'cas':<36} {'temps (s)':>10} {'baseline':>10} {'RSS (Mo)':>9} {'parses':>7} {'ouvert.':>8}"
+    lines = [head, "-"*len(head)]
+    for r in results:
+        base = f"{r['baseline_wall_s']:.3f}" if "baseline_wall_s" in r else "-"
+        rss = f"{r['peak_rss_mb']:.1f}" if r.get("peak_rss_mb") is not None else "-"
+        lines.append(f"{r['key']:<36} {r['wall_s']:>10.3f} {base:>10} {rss:>9} {r['sheet_parses']:>7} {r['workbook_loads']:>8}" + (f"  ({r['error']})" if r.get("error") else ""))
+    return "\n".join(lines)
+
+def _int_list(s: str) -> list:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks calcul / exports sur classeurs synthétiques.")
+    ap.add_argument("--apartments", default="10,100", type=_int_list)
+    ap.add_argument("--periods", default="12", type=_int_list)
+    ap.add_argument("--frais-rows", default="200", type=_int_list)
+    ap.add_argument("--frais-sheets", default=6, type=int)
+    ap.add_argument("--cases", default=",".join(CASES))
+    ap.add_argument("--save-baseline", action="store_true", help="Écrit les résultats comme nouvelle baseline.")
+    ap.add_argument("--tolerance", default=0.25, type=float, help="Dépassement de temps toléré vs baseline (0.25 = +25 %%).")
+    args = ap.parse_args(argv)
+    cases = [c for c in args.cases.split(",") if c]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown: ap.error(f"cas inconnus: {unknown} (disponibles: {', '.join(CASES)})")
+    results = run(args.apartments, args.periods, args.frais_rows, args.frais_sheets, cases)
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(), "results": results}
+    regressions = []
+    if BASELINE.exists() and not args.save_baseline:
+        regressions = compare(results, json.loads(BASELINE.read_text(encoding="utf-8")), args.tolerance)
+    RESULTS.mkdir(exist_ok=True)
+    (RESULTS / "latest.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(summary_table(results))
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) par rapport à {BASELINE.name}:")
+        for r in regressions: print(f"  - {r['key']}: {r['wall_s']:.3f} s (baseline {r.get('baseline_wall_s', '-')})")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
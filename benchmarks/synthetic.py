@@ -0,0 +1,51 @@
+"""Générateurs de classeurs synthétiques (charges, SI, frais) pour les benchmarks."""
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+CONSUMPTION_SHEETS = ("Eau Froide", "Eau Chaude", "Chauffage", "Refroidissement")
+ENERGY_SHEETS = ("PAC", "Communs")
+SI_COLUMNS = ["Consommation Eau","Taxe épuration Eau","HP énergie","HP acheminement","HC énergie","HC acheminement","Swissgrid",
+              "Taxe fédérale énergies renouvelables","Taxe cantonale énergie","Taxe communale usage du sol",
+              "Taxe communale éclairage public","Taxes communales environnementales","TVA","Prix kWh Solaire"]
+
+def periods(n_periods: int, start_year: int = 2020) -> list:
+    return [f"{start_year + i//12}-{i%12 + 1:02d}" for i in range(n_periods)]
+
+def apartments(n_apartments: int) -> list:
+    return [f"App{i:03d}" for i in range(1, n_apartments + 1)]
+
+def make_charges(path: Path, n_apartments: int = 10, n_periods: int = 12, seed: int = 0) -> Path:
+    """Classeur de charges avec les feuilles réelles: relevés par appartement, kWh PAC/Communs et 'Frais Eau'."""
+    rng = np.random.default_rng(seed); per = periods(n_periods); apts = apartments(n_apartments)
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        for sh in CONSUMPTION_SHEETS:
+            d = {"Période": per}
+            for a in apts: d[a] = rng.uniform(0, 120, n_periods).round(3)
+            d["Communs"] = rng.uniform(0, 20, n_periods).round(3)
+            pd.DataFrame(d).to_excel(w, sheet_name=sh, index=False)
+        for sh in ENERGY_SHEETS:
+            pd.DataFrame({"Période": per, "HP_kwh": rng.uniform(500, 5000, n_periods).round(1), "HC_kwh": rng.uniform(500, 5000, n_periods).round(1),
+                          "Solaire_kwh": rng.uniform(0, 2000, n_periods).round(1)}).to_excel(w, sheet_name=sh, index=False)
+        pd.DataFrame({"Période": per, "Consommation (CHF)": [2.15]*n_periods, "Taxe épuration (CHF)": [1.35]*n_periods}).to_excel(w, sheet_name="Frais Eau", index=False)
+    return Path(path)
+
+def make_si(path: Path, n_periods: int = 12, seed: int = 0) -> Path:
+    """Fichier SI avec la feuille 'Données' (une ligne par période, prix unitaires en CHF)."""
+    rng = np.random.default_rng(seed)
+    d = {"Période": periods(n_periods)}
+    for c in SI_COLUMNS: d[c] = rng.uniform(0.005, 0.12, n_periods).round(4)
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        pd.DataFrame(d).to_excel(w, sheet_name="Données", index=False)
+    return Path(path)
+
+def make_frais(path: Path, n_sheets: int = 6, n_rows: int = 100, seed: int = 0) -> Path:
+    """Classeur de frais divers: n_sheets feuilles de n_rows lignes plus une feuille 'frais divers' vide."""
+    rng = np.random.default_rng(seed)
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        for i in range(n_sheets):
+            pd.DataFrame({"Description": [f"Frais {i}-{j}" for j in range(n_rows)],
+                          "Montant (CHF)": rng.uniform(5, 900, n_rows).round(2),
+                          "Date": pd.date_range("2024-01-01", periods=n_rows, freq="D")}).to_excel(w, sheet_name=f"Groupe {i+1}", index=False)
+        pd.DataFrame(columns=["Description", "Montant (CHF)", "Groupe"]).to_excel(w, sheet_name="frais divers", index=False)
+    return Path(path)
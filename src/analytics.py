@@ -0,0 +1,277 @@
+from __future__ import annotations
+from pathlib import Path
+import os
+import pickle
+import re
+import sqlite3
+from src.lazy import LazyModule
+from src import instrument
+from src.file_io import _prune_frame, excel_pool
+from src.history import HISTORY_COLUMNS
+from src.app_logic import is_apartment_column
+
+pd = LazyModule("pandas")
+
+STORE_VERSION = 2
+HISTORY_DB = "historique.sqlite"
+HISTORY_XLSX = re.compile(r"^Historique_factures_(\d{4})\.xlsx$", re.IGNORECASE)
+READING_SHEETS = {"Eau Froide":"Eau_froide_m3","Eau Chaude":"Eau_chaude_m3","Chauffage":"Chauffage_kWh","Refroidissement":"Refroid_kWh"}
+ENERGY_SHEETS = {"PAC":"PAC","Communs":"COMMUNS"}
+VALUE_COLUMNS = HISTORY_COLUMNS[1:]
+COMPONENTS = ["Montant_energie","Montant_eau","Total_CHF"]
+BILLING_COLUMNS = ["Dossier","Immeuble","Période","Année","Appartement",*VALUE_COLUMNS,"Source"]
+READING_COLUMNS = ["Immeuble","Classeur","Période","Année","Appartement","Mesure","Valeur"]
+_SOURCE_RANK = {"sqlite": 0, "xlsx": 1}
+
+def _stamp(path: Path):
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+def _years(periods: pd.Series) -> pd.Series:
+    """Année d'une période ('2025-12', '2025', date Excel...): quatre premiers chiffres consécutifs, sinon vide."""
+    return periods.astype(str).str.extract(r"((?:19|20)\d{2})", expand=False).fillna("")
+
+def _columnar(df: pd.DataFrame, categories) -> pd.DataFrame:
+    for c in categories:
+        if c in df.columns: df[c] = df[c].astype(str).astype("category")
+    return df
+
+def _read_history_db(path: Path) -> pd.DataFrame:
+    cols = ", ".join(f'"{c}"' for c in VALUE_COLUMNS)
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        df = pd.read_sql_query(f'SELECT immeuble AS "Immeuble", periode AS "Période", appartement AS "Appartement", {cols} FROM factures', con)
+    finally:
+        con.close()
+    df["Source"] = "sqlite"
+    return df
+
+def _read_history_xlsx(path: Path) -> pd.DataFrame:
+    with excel_pool.open(path) as xls:
+        df = xls.parse(0)
+    if "Période" not in df.columns or "Appartement" not in df.columns: return None
+    df = df.reindex(columns=["Immeuble","Période","Appartement",*VALUE_COLUMNS])
+    df["Immeuble"] = df["Immeuble"].fillna("").astype(str)
+    df["Source"] = "xlsx"
+    return df
+
+def _read_charges(path: Path) -> pd.DataFrame:
+    """
+    Relevés de toutes les périodes d'un classeur de charges, en format long (Période, Appartement, Mesure, Valeur).
+    Seules les colonnes d'appartements sont reprises (mêmes exclusions que l'inférence des locataires);
+    les kWh PAC / Communs viennent de leurs feuilles, sous les appartements 'PAC' et 'COMMUNS'.
+    """
+    parts = []
+    with excel_pool.open(path) as xls:
+        names = set(xls.sheet_names)
+        for sheet, measure in READING_SHEETS.items():
+            if sheet not in names: continue
+            df = _prune_frame(xls.parse(sheet))
+            if "Période" not in df.columns: continue
+            vals = df[[c for c in df.columns if is_apartment_column(c)]].apply(pd.to_numeric, errors="coerce").dropna(axis=1, how="all")
+            long = vals.assign(Période=df["Période"].astype(str)).melt(id_vars="Période", var_name="Appartement", value_name="Valeur")
+            parts.append(long.assign(Mesure=measure))
+        for sheet, apt in ENERGY_SHEETS.items():
+            if sheet not in names: continue
+            df = _prune_frame(xls.parse(sheet))
+            cols = [c for c in ("HP_kwh","HC_kwh","Solaire_kwh") if c in df.columns]
+            if "Période" not in df.columns or not cols: continue
+            vals = df[cols].apply(pd.to_numeric, errors="coerce")
+            long = vals.assign(Période=df["Période"].astype(str)).melt(id_vars="Période", var_name="Mesure", value_name="Valeur")
+            parts.append(long.assign(Appartement=apt))
+    if not parts: return None
+    out = pd.concat(parts, ignore_index=True).dropna(subset=["Valeur"])
+    out["Appartement"] = out["Appartement"].astype(str)
+    return out
+
+class AnalyticsIndex:
+    """
+    Index analytique multi-années: historiques de facturation (historique.sqlite, Historique_factures_{année}.xlsx)
+    et relevés de tous les classeurs de charges, stockés en colonnes (catégories + float64) dans un pickle.
+
+    refresh() ne relit que les sources nouvelles ou modifiées (mtime, taille); les requêtes travaillent
+    ensuite en mémoire (groupby vectorisés), sans reparser aucun xlsx.
+
+        idx = AnalyticsIndex(base_dir / ".cache" / "analytics.pkl")
+        idx.refresh(roots=[out_dir], charges=[charges_path])
+        idx.per_apartment("Total_CHF")               # Appartement x Année
+        idx.trend("Eau_chaude_m3", by="Année")       # relevés EC par année et appartement
+
+    Une même facture présente à la fois dans la base SQLite et dans sa vue xlsx n'est comptée qu'une fois.
+    """
+    def __init__(self, store_path: Path):
+        self.store_path = Path(store_path)
+        self._sources = {}     # chemin -> {"stamp", "kind", "frame"}
+        self._billing = None; self._readings = None
+        self.stats = {"indexed": 0, "reused": 0, "dropped": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.store_path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if isinstance(data, dict) and data.get("version") == STORE_VERSION:
+            self._sources = data.get("sources", {})
+
+    def _save(self):
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.store_path.with_name(f"{self.store_path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({"version": STORE_VERSION, "sources": self._sources}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.store_path)
+
+    @staticmethod
+    def discover(roots) -> list:
+        """Historiques (base SQLite et xlsx annuels) sous les dossiers donnés (récursif)."""
+        found = []
+        for root in roots or []:
+            root = Path(root)
+            if root.is_file(): found.append(root); continue
+            if not root.is_dir(): continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for fn in filenames:
+                    if fn == HISTORY_DB or HISTORY_XLSX.match(fn): found.append(Path(dirpath) / fn)
+        return found
+
+    def _index_one(self, path: Path, kind: str):
+        if kind == "charges":
+            frame = _read_charges(path)
+            if frame is not None: frame.insert(0, "Classeur", path.stem)
+        else:
+            frame = _read_history_db(path) if path.name == HISTORY_DB else _read_history_xlsx(path)
+            if frame is not None: frame.insert(0, "Dossier", str(path.parent))
+        return frame
+
+    @instrument.timed("analytics.refresh")
+    def refresh(self, roots=(), charges=(), prune: bool = True) -> dict:
+        """
+        Indexe les sources nouvelles ou modifiées; prune=True oublie celles qui ne sont plus trouvées.
+        charges: chemins de classeurs de charges, ou paires (immeuble, chemin).
+        Une source illisible est ignorée (et retirée de l'index). Retourne les compteurs indexed/reused/dropped.
+        """
+        wanted = {str(p.resolve()): ("history", "") for p in self.discover(roots)}
+        for item in charges or []:
+            building, p = item if isinstance(item, (tuple, list)) else ("", item)
+            if p and Path(p).is_file(): wanted[str(Path(p).resolve())] = ("charges", building or "")
+        changed = False; stats = {"indexed": 0, "reused": 0, "dropped": 0}
+        for key, (kind, building) in wanted.items():
+            path = Path(key)
+            try:
+                stamp = _stamp(path)
+            except OSError:
+                continue
+            cur = self._sources.get(key)
+            if cur is not None and cur["stamp"] == stamp and cur["kind"] == kind:
+                if cur.get("building", "") != building: cur["building"] = building; changed = True
+                stats["reused"] += 1; continue
+            with instrument.span("analytics.index", source=path.name):
+                try:
+                    frame = self._index_one(path, kind)
+                except Exception:
+                    frame = None
+            self._sources[key] = {"stamp": stamp, "kind": kind, "building": building, "frame": frame}
+            stats["indexed"] += 1; changed = True
+        if prune:
+            for key in [k for k in self._sources if k not in wanted]:
+                del self._sources[key]; stats["dropped"] += 1; changed = True
+        if changed:
+            self._billing = self._readings = None
+            self._save()
+        self.stats = stats
+        return stats
+
+    @property
+    def billing(self) -> pd.DataFrame:
+        """Une ligne par (dossier, immeuble, période, appartement), colonnes BILLING_COLUMNS."""
+        if self._billing is None:
+            frames = [s["frame"] for s in self._sources.values() if s["kind"] == "history" and s["frame"] is not None]
+            if not frames:
+                self._billing = pd.DataFrame(columns=BILLING_COLUMNS)
+            else:
+                df = pd.concat(frames, ignore_index=True)
+                df["Période"] = df["Période"].astype(str); df["Appartement"] = df["Appartement"].astype(str)
+                df["Immeuble"] = df["Immeuble"].fillna("").astype(str)
+                df["Année"] = _years(df["Période"])
+                for c in VALUE_COLUMNS: df[c] = pd.to_numeric(df[c], errors="coerce")
+                df = (df.assign(_rang=df["Source"].map(_SOURCE_RANK)).sort_values("_rang", kind="stable")
+                        .drop_duplicates(["Dossier","Immeuble","Période","Appartement"]).drop(columns="_rang").sort_index())
+                self._billing = _columnar(df.reindex(columns=BILLING_COLUMNS).reset_index(drop=True), ["Dossier","Immeuble","Période","Année","Appartement","Source"])
+        return self._billing
+
+    @property
+    def readings(self) -> pd.DataFrame:
+        """
+        Relevés en format long, colonnes READING_COLUMNS. Si plusieurs classeurs d'un même immeuble
+        couvrent la même période, le plus récemment modifié l'emporte.
+        """
+        if self._readings is None:
+            srcs = sorted((s for s in self._sources.values() if s["kind"] == "charges" and s["frame"] is not None), key=lambda s: s["stamp"][0])
+            if not srcs:
+                self._readings = pd.DataFrame(columns=READING_COLUMNS)
+            else:
+                df = pd.concat([s["frame"].assign(Immeuble=s.get("building", "")) for s in srcs], ignore_index=True)
+                df = df.drop_duplicates(["Immeuble","Période","Appartement","Mesure"], keep="last")
+                df["Année"] = _years(df["Période"])
+                self._readings = _columnar(df.reindex(columns=READING_COLUMNS).reset_index(drop=True), ["Immeuble","Classeur","Période","Année","Appartement","Mesure"])
+        return self._readings
+
+    @staticmethod
+    def _filter(df: pd.DataFrame, years=None, apartments=None, building=None) -> pd.DataFrame:
+        mask = pd.Series(True, index=df.index)
+        if years is not None: mask &= df["Année"].isin([str(y) for y in years])
+        if apartments is not None: mask &= df["Appartement"].isin([str(a) for a in apartments])
+        if building is not None and "Immeuble" in df.columns: mask &= df["Immeuble"] == building
+        return df[mask]
+
+    def _billed(self, years=None, apartments=None, building=None, include_common: bool = False) -> pd.DataFrame:
+        df = self._filter(self.billing, years, apartments, building)
+        if not include_common: df = df[~df["Appartement"].isin(["PAC","COMMUNS","TOTAL"])]
+        return df
+
+    def per_apartment(self, value: str = "Total_CHF", years=None, building=None) -> pd.DataFrame:
+        """Somme de value par appartement (lignes) et année (colonnes)."""
+        df = self._billed(years, building=building)
+        return df.pivot_table(index="Appartement", columns="Année", values=value, aggfunc="sum", observed=True).sort_index()
+
+    def per_period(self, value: str = "Total_CHF", years=None, building=None) -> pd.DataFrame:
+        """Par période: total, moyenne et nombre d'appartements facturés."""
+        df = self._billed(years, building=building)
+        out = df.groupby("Période", observed=True)[value].agg(["sum","mean","count"]).rename(columns={"sum":"Total","mean":"Moyenne","count":"Appartements"})
+        return out.sort_index()
+
+    def per_component(self, by: str = "Année", years=None, apartments=None, building=None) -> pd.DataFrame:
+        """Montants énergie / eau / total par année, période ou appartement."""
+        df = self._billed(years, apartments, building)
+        return df.groupby(by, observed=True)[COMPONENTS].sum().sort_index()
+
+    def trend(self, measure: str = "Eau_froide_m3", by: str = "Année", apartments=None, years=None, building=None, source: str = None) -> pd.DataFrame:
+        """
+        Évolution d'une mesure (Eau_froide_m3, Eau_chaude_m3, Chauffage_kWh, Refroid_kWh, HP_kwh...) par année ou période,
+        une colonne par appartement (by='Appartement': une ligne par appartement, une colonne par année). source: 'readings' (relevés des classeurs), 'billing' (valeurs facturées) ou None
+        (relevés si la mesure y figure, sinon historique).
+        """
+        cols = "Année" if by == "Appartement" else "Appartement"
+        rd = self.readings
+        if source is None: source = "readings" if (rd["Mesure"] == measure).any() else "billing"
+        if source == "readings":
+            df = self._filter(rd[rd["Mesure"] == measure], years, apartments, building)
+            return df.pivot_table(index=by, columns=cols, values="Valeur", aggfunc="sum", observed=True).sort_index()
+        df = self._billed(years, apartments, building)
+        return df.pivot_table(index=by, columns=cols, values=measure, aggfunc="sum", observed=True).sort_index()
+
+    def summary(self, years=None, building=None) -> pd.DataFrame:
+        """Tableau annuel: appartements facturés, consommations (m³, kWh) et montants."""
+        df = self._billed(years, building=building)
+        g = df.groupby("Année", observed=True)
+        out = g[["Eau_froide_m3","Eau_chaude_m3","Chauffage_kWh","Refroid_kWh",*COMPONENTS]].sum()
+        out.insert(0, "Appartements", g["Appartement"].nunique())
+        out.insert(1, "Périodes", g["Période"].nunique())
+        return out.sort_index()
+
+def format_table(df: pd.DataFrame, floatfmt: str = "{:,.2f}") -> str:
+    """Rendu texte d'un résultat de requête (CLI / zone de texte de l'interface)."""
+    if df is None or df.empty: return "(aucune donnée)"
+    return df.to_string(float_format=lambda v: floatfmt.format(v).replace(",", " "), na_rep="-")
@@ -0,0 +1,142 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import traceback
+import pandas as pd
+from src.file_io import excel_pool
+
+JOB_KEYS = ("building", "charges_path", "si_path", "tenants_path", "period", "out_dir")
+EXPORTS = ("log", "xlsx", "pdf", "pdf-merged", "log-xlsx")
+
+def load_manifest(path: Path) -> list:
+    """
+    Lit un manifeste de facturation groupée: JSON (liste d'objets) ou tableau xlsx/csv,
+    une ligne par tâche avec les colonnes building, charges_path, si_path, tenants_path, period (out_dir optionnel).
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        jobs = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(jobs, dict): jobs = jobs.get("jobs", [])
+    else:
+        if path.suffix.lower() == ".csv":
+            df = pd.read_csv(path)
+        else:
+            with excel_pool.open(path) as xls:
+                df = xls.parse(0)
+        jobs = df.where(df.notna(), None).to_dict("records")
+    out = []
+    for i, job in enumerate(jobs):
+        if not job.get("charges_path"):
+            raise ValueError(f"Manifeste {path.name}, tâche {i+1}: 'charges_path' manquant.")
+        out.append({k: (str(job.get(k)) if job.get(k) is not None else "") for k in JOB_KEYS})
+    return out
+
+def run_job(job: dict, base_dir: Path):
+    """Calcule la répartition d'une tâche. Lève en cas d'erreur (lecture stricte, pas de prix nuls silencieux)."""
+    from src.config_loader import ConfigManager
+    from src.app_logic import CalculationEngine
+    eng = CalculationEngine(ConfigManager(base_dir, watch_interval=0))
+    tenants = eng.load_tenants(job.get("tenants_path") or None, strict=True)
+    rep_df, details_df, details_text = eng.build_repartitions(job["charges_path"], tenants, si_path=job.get("si_path") or None, strict=True)
+    for df in (rep_df, details_df):
+        df.insert(0, "Période", job.get("period", "")); df.insert(0, "Immeuble", job.get("building", ""))
+    return rep_df, details_df, details_text
+
+def _run_job_safe(job: dict, base_dir: Path):
+    try:
+        return job, run_job(job, base_dir), None
+    except Exception as e:
+        return job, None, {**job, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+def _map_jobs(fn, jobs: list, args: tuple, max_workers: int = None, progress=None) -> list:
+    """
+    fn(job, *args) -> (job, résultat, erreur) pour chaque tâche, en processus parallèles; résultats dans l'ordre des tâches.
+    Un processus de travail qui meurt (mémoire, extension native) donne un rapport d'erreur par tâche concernée
+    (BrokenProcessPool), sans perdre les résultats déjà obtenus.
+    """
+    results = [None]*len(jobs)
+    def _collect(done, idx, job, res, err):
+        results[idx] = (res, err)
+        if progress: progress(done, len(jobs), job, err)
+    if max_workers == 1 or len(jobs) <= 1:
+        for i, job in enumerate(jobs):
+            _collect(i+1, i, *fn(job, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            futs = {ex.submit(fn, job, *args): i for i, job in enumerate(jobs)}
+            for done, fut in enumerate(as_completed(futs), 1):
+                i = futs[fut]
+                try:
+                    out = fut.result()
+                except (Exception, SystemExit) as e:  # SystemExit: levé par la tâche dans le processus de travail
+                    out = (jobs[i], None, {**jobs[i], "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()})
+                _collect(done, i, *out)
+    return results
+
+def run_batch(jobs: list, base_dir: Path, max_workers: int = None, progress=None):
+    """
+    Exécute les tâches en parallèle (ProcessPoolExecutor; max_workers=1: séquentiel dans le processus courant).
+    Une tâche en échec n'interrompt pas les autres.
+    progress(done, total, job, error) est appelé à la fin de chaque tâche.
+    Retourne (repartitions, details, errors): deux DataFrames consolidés (colonnes Immeuble/Période en tête)
+    et une liste de rapports d'erreur (champs de la tâche + error + traceback).
+    Sous Windows, l'appelant doit être protégé par `if __name__ == "__main__":`.
+    """
+    done = _map_jobs(_run_job_safe, jobs, (str(base_dir),), max_workers, progress)
+    ordered = [res for res, err in done if err is None]
+    errors = [err for res, err in done if err is not None]
+    rep_all = pd.concat([r[0] for r in ordered], ignore_index=True) if ordered else pd.DataFrame()
+    details_all = pd.concat([r[1] for r in ordered], ignore_index=True) if ordered else pd.DataFrame()
+    return rep_all, details_all, errors
+
+def job_out_dir(job: dict, out_root: Path) -> Path:
+    """Dossier de sortie d'une tâche: out_dir de la tâche, sinon out_root/<immeuble ou nom du fichier de charges>."""
+    from src.invoice_render import safe_filename
+    if job.get("out_dir"): return Path(job["out_dir"])
+    return Path(out_root) / safe_filename(job.get("building") or Path(job["charges_path"]).stem)
+
+def bill_job(job: dict, base_dir: Path, out_dir: Path, exports=EXPORTS[:3], workers: int = 1) -> dict:
+    """
+    Répartition puis exports (log, xlsx, pdf, pdf-merged, log-xlsx) d'une tâche dans out_dir.
+    log enregistre la période dans historique.sqlite; log-xlsx régénère en plus la vue Historique_factures_{année}.xlsx.
+    Retourne un résumé sérialisable en JSON (fichiers écrits, nombre de factures, total CHF). Lève en cas d'erreur.
+    """
+    from src.config_loader import ConfigManager
+    from src.app_logic import CalculationEngine
+    from src.history import period_year
+    if not job.get("period"): raise ValueError("Période manquante (ex. 2025-12).")
+    unknown = [e for e in exports if e not in EXPORTS]
+    if unknown: raise ValueError(f"Exports inconnus: {unknown} (disponibles: {', '.join(EXPORTS)})")
+    eng = CalculationEngine(ConfigManager(base_dir, watch_interval=0))
+    tenants = eng.load_tenants(job.get("tenants_path") or None, strict=True)
+    rep_df, details_df, details_text = eng.build_repartitions(job["charges_path"], tenants, si_path=job.get("si_path") or None, strict=True)
+    out_dir = Path(out_dir); period = job["period"]
+    files = {}
+    if "log" in exports:
+        files["log"] = str(eng.export_log(out_dir, period, rep_df, building=job.get("building", "")))
+    if "xlsx" in exports:
+        files["xlsx"] = eng.export_invoices_xlsx(out_dir, period, rep_df, None, workers=workers)[1]
+    if "pdf" in exports:
+        files["pdf"] = eng.export_invoices_pdf(out_dir, period, rep_df, None, workers=workers, details_df=details_df)[1]
+    if "pdf-merged" in exports:
+        files["pdf-merged"] = eng.export_invoices_pdf(out_dir, period, rep_df, None, merged=True)[1]
+    if "log-xlsx" in exports:
+        files["log-xlsx"] = eng.export_history_xlsx(out_dir, period_year(period))[0]
+    apts = rep_df[~rep_df["Appartement"].isin(["PAC", "COMMUNS"])] if not rep_df.empty else rep_df
+    return {**job, "out_dir": str(out_dir), "apartments": int(len(apts)),
+            "total_chf": round(float(apts["Total_CHF"].sum()), 2) if len(apts) else 0.0, "files": files}
+
+def _bill_job_safe(job: dict, base_dir: str, out_root: str, exports, workers: int):
+    try:
+        return job, bill_job(job, base_dir, job_out_dir(job, out_root), exports, workers), None
+    except Exception as e:
+        return job, None, {**job, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+def run_billing(jobs: list, base_dir: Path, out_root: Path, exports=EXPORTS[:3], max_workers: int = None, progress=None, workers: int = 1):
+    """
+    Comme run_batch, mais chaque tâche écrit aussi ses exports (voir bill_job) dans job_out_dir(job, out_root).
+    workers: processus de rendu par tâche (défaut 1: le parallélisme se fait entre immeubles).
+    Retourne (résumés des tâches réussies, rapports d'erreur).
+    """
+    done = _map_jobs(_bill_job_safe, jobs, (str(base_dir), str(out_root), tuple(exports), workers), max_workers, progress)
+    return [res for res, err in done if err is None], [err for res, err in done if err is not None]
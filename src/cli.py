@@ -0,0 +1,166 @@
+"""
+Facturation sans interface graphique (serveur, CI, tâches planifiées). N'importe pas tkinter.
+
+    python cli.py run --charges Charges_2025.xlsx --si Donnees_SI_2025.xlsx --period 2025-12 --out factures_out/2025
+    python cli.py batch --manifest immeubles.json --out factures_out --jobs 4
+    python cli.py run --period 2025-12 --exports log,pdf-merged     # chemins repris des réglages
+    python cli.py history --out factures_out/2025 --year 2025              # vue xlsx de l'historique SQLite
+    python cli.py analytics --query per-apartment --years 2023,2024,2025 --format csv
+
+Un résumé JSON est écrit sur la sortie standard (et dans --summary si donné), les journaux sur la sortie d'erreur.
+analytics lit l'index analytique (.cache/analytics.pkl), ne réindexant que les historiques et classeurs modifiés.
+Codes retour: 0 succès, 1 au moins une tâche en échec, 2 arguments ou manifeste invalides.
+"""
+from pathlib import Path
+import argparse
+import json
+import logging
+import sys
+import time
+
+EXIT_OK, EXIT_FAILED, EXIT_USAGE = 0, 1, 2
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+logger = logging.getLogger("perplexity.cli")
+
+def _exports(s: str) -> tuple:
+    from src.batch import EXPORTS
+    out = tuple(e.strip() for e in s.split(",") if e.strip())
+    unknown = [e for e in out if e not in EXPORTS]
+    if unknown: raise argparse.ArgumentTypeError(f"exports inconnus: {unknown} (disponibles: {', '.join(EXPORTS)})")
+    return out
+
+def build_parser() -> argparse.ArgumentParser:
+    base = argparse.ArgumentParser(add_help=False)
+    base.add_argument("--base-dir", default=str(BASE_DIR), help="Dossier des réglages (user_settings.json, assets/).")
+    base.add_argument("-v", "--verbose", action="store_true")
+    common = argparse.ArgumentParser(add_help=False, parents=[base])
+    common.add_argument("--exports", default="log,xlsx,pdf", type=_exports, help="Exports à produire: log, xlsx, pdf, pdf-merged, log-xlsx (défaut: %(default)s). "
+                        "log enregistre dans historique.sqlite; log-xlsx régénère aussi Historique_factures_{année}.xlsx.")
+    common.add_argument("--summary", help="Écrit aussi le résumé JSON dans ce fichier.")
+    ap = argparse.ArgumentParser(prog="cli.py", description="Répartition des charges et exports (factures, historique) sans interface graphique.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", parents=[common], help="Un immeuble: chemins en arguments (défaut: réglages).")
+    run.add_argument("--period", required=True, help="Période facturée, ex. 2025-12.")
+    run.add_argument("--charges", help="Classeur de charges (défaut: réglage charges_path).")
+    run.add_argument("--si", help="Fichier SI (défaut: réglage si_path).")
+    run.add_argument("--tenants", help="Fichier locataires (défaut: réglage tenants_path si --charges est omis, sinon appartements déduits du classeur).")
+    run.add_argument("--building", default="", help="Nom de l'immeuble (colonne Immeuble de l'historique).")
+    run.add_argument("--out", help="Dossier de sortie (défaut: réglage output_dir, sinon ./factures_out).")
+    run.add_argument("--workers", type=int, help="Processus de rendu des factures (défaut: automatique).")
+    batch = sub.add_parser("batch", parents=[common], help="Plusieurs immeubles depuis un manifeste json/csv/xlsx (voir batch.load_manifest).")
+    batch.add_argument("--manifest", required=True)
+    batch.add_argument("--out", default="factures_out", help="Dossier racine; une tâche sans out_dir écrit dans <out>/<immeuble>.")
+    batch.add_argument("--jobs", type=int, help="Immeubles traités en parallèle (défaut: nombre de CPU).")
+    hist = sub.add_parser("history", parents=[base], help="Matérialise Historique_factures_{année}.xlsx depuis historique.sqlite.")
+    hist.add_argument("--out", help="Dossier contenant historique.sqlite (défaut: réglage output_dir).")
+    hist.add_argument("--year", help="Année à exporter (défaut: toutes les années de la base).")
+    an = sub.add_parser("analytics", parents=[base], help="Tableaux multi-années depuis l'index analytique (historiques et relevés).")
+    an.add_argument("--query", default="summary", choices=["summary", "per-apartment", "per-period", "per-component", "trend"])
+    an.add_argument("--root", action="append", help="Dossier contenant des historiques (répétable; défaut: réglage output_dir).")
+    an.add_argument("--charges", action="append", help="Classeur de charges à indexer, CHEMIN ou IMMEUBLE=CHEMIN (répétable; défaut: réglage charges_path).")
+    an.add_argument("--store", help="Fichier de l'index (défaut: <base-dir>/.cache/analytics.pkl).")
+    an.add_argument("--value", default="Total_CHF", help="Colonne sommée (per-apartment, per-period; défaut: %(default)s).")
+    an.add_argument("--measure", default="Eau_froide_m3", help="Mesure suivie par trend (défaut: %(default)s).")
+    an.add_argument("--by", default="Année", choices=["Année", "Période", "Appartement"], help="Regroupement (per-component, trend).")
+    an.add_argument("--years", type=_csv_list, help="Années retenues, ex. 2024,2025.")
+    an.add_argument("--apartments", type=_csv_list, help="Appartements retenus, ex. App001,App002.")
+    an.add_argument("--building", help="Immeuble retenu.")
+    an.add_argument("--format", default="table", choices=["table", "json", "csv"])
+    return ap
+
+def _csv_list(s: str) -> list:
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+def _history_xlsx(args) -> list:
+    from src.config_loader import ConfigManager
+    from src.app_logic import CalculationEngine
+    cfg = ConfigManager(args.base_dir, watch_interval=0)
+    out = args.out or (cfg.resolve_path(cfg.load_user_setting("output_dir", "")) if cfg.load_user_setting("output_dir", "") else "")
+    if not out: raise ValueError("Aucun dossier d'historique (--out ou réglage output_dir).")
+    return CalculationEngine(cfg).export_history_xlsx(out, args.year)
+
+def _analytics(args) -> str:
+    from src.config_loader import ConfigManager
+    from src.analytics import AnalyticsIndex, format_table
+    cfg = ConfigManager(args.base_dir, watch_interval=0)
+    def setting(key):
+        p = cfg.load_user_setting(key, "")
+        return cfg.resolve_path(p) if p else ""
+    roots = args.root or [r for r in [setting("output_dir")] if r]
+    charges = [tuple(c.split("=", 1)) if "=" in c else c for c in args.charges] if args.charges else [c for c in [setting("charges_path")] if c]
+    idx = AnalyticsIndex(args.store or Path(args.base_dir) / ".cache" / "analytics.pkl")
+    stats = idx.refresh(roots=roots, charges=charges)
+    logger.info("Index analytique: %(indexed)d source(s) indexée(s), %(reused)d reprise(s), %(dropped)d retirée(s)", stats)
+    opts = {"years": args.years, "building": args.building}
+    if args.query == "summary": df = idx.summary(**opts)
+    elif args.query == "per-apartment": df = idx.per_apartment(args.value, **opts)
+    elif args.query == "per-period": df = idx.per_period(args.value, **opts)
+    elif args.query == "per-component": df = idx.per_component(args.by, apartments=args.apartments, **opts)
+    else: df = idx.trend(args.measure, args.by, apartments=args.apartments, **opts)
+    if args.format == "csv": return df.to_csv()
+    if args.format == "json": return df.reset_index().to_json(orient="records", force_ascii=False, indent=2)
+    return format_table(df)
+
+def _single_job(args, exports) -> tuple:
+    from src.config_loader import ConfigManager
+    from src.batch import run_billing
+    cfg = ConfigManager(args.base_dir, watch_interval=0)
+    def setting(value, key):
+        if value: return value
+        p = cfg.load_user_setting(key, "")
+        return cfg.resolve_path(p) if p else ""
+    job = {"building": args.building, "charges_path": setting(args.charges, "charges_path"), "si_path": setting(args.si, "si_path"),
+           "tenants_path": args.tenants or ("" if args.charges else setting(None, "tenants_path")), "period": args.period,
+           "out_dir": setting(args.out, "output_dir") or str(Path("factures_out").resolve())}
+    if not job["charges_path"]: raise ValueError("Aucun classeur de charges (--charges ou réglage charges_path).")
+    return run_billing([job], args.base_dir, job["out_dir"], exports, max_workers=1, workers=args.workers)
+
+def _batch_jobs(args, exports) -> tuple:
+    from src.batch import load_manifest, run_billing
+    jobs = load_manifest(args.manifest)
+    def progress(done, total, job, err):
+        name = job.get("building") or Path(job["charges_path"]).name
+        if err: logger.error("[%d/%d] %s: %s", done, total, name, err["error"])
+        else: logger.info("[%d/%d] %s: terminé", done, total, name)
+    return run_billing(jobs, args.base_dir, args.out, exports, max_workers=args.jobs, progress=progress)
+
+def main(argv=None) -> int:
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(levelname)s %(message)s", stream=sys.stderr)
+    if args.command == "history":
+        try:
+            files = _history_xlsx(args)
+        except (OSError, ValueError) as e:
+            logger.error("%s", e)
+            print(json.dumps({"status": "error", "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False))
+            return EXIT_USAGE
+        print(json.dumps({"status": "ok", "command": "history", "files": files}, ensure_ascii=False, indent=2))
+        return EXIT_OK
+    if args.command == "analytics":
+        try:
+            print(_analytics(args))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("%s", e)
+            return EXIT_USAGE
+        return EXIT_OK
+    t0 = time.perf_counter()
+    try:
+        results, errors = (_single_job if args.command == "run" else _batch_jobs)(args, args.exports)
+    except (OSError, ValueError) as e:
+        logger.error("%s", e)
+        print(json.dumps({"status": "error", "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False))
+        return EXIT_USAGE
+    for err in errors:
+        logger.debug("%s", err.get("traceback", ""))
+    summary = {"status": "failed" if errors else "ok", "command": args.command, "exports": list(args.exports),
+               "wall_s": round(time.perf_counter() - t0, 3), "jobs": results,
+               "errors": [{k: v for k, v in e.items() if k != "traceback"} for e in errors]}
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.summary: Path(args.summary).write_text(text, encoding="utf-8")
+    return EXIT_FAILED if errors else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
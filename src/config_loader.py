@@ -1,8 +1,21 @@
 from pathlib import Path
+from contextlib import contextmanager
 import json
+import os
+import threading
+import time
+from src.path_resolver import PathResolver
 
 class ConfigManager:
-    def __init__(self, base_dir: Path):
+    """
+    Réglages fusionnés (user_settings.json < assets/paths.json < assets/UserSettings.json), chargés une fois en mémoire.
+    - save_user_setting écrit immédiatement, sauf dans un bloc `with cfg.batch():` (une seule écriture en sortie).
+    - Écritures atomiques (fichier temporaire + renommage).
+    - watch_interval (s): fréquence max de vérification des mtime pour reprendre les modifications externes (0: désactivé).
+    """
+    PATH_KEYS = ["charges_path","tenants_path","frais_path","si_path","output_dir"]
+
+    def __init__(self, base_dir: Path, watch_interval: float = 2.0):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
         self.assets_dir = self.base_dir / "assets"; self.assets_dir.mkdir(parents=True, exist_ok=True)
@@ -12,6 +25,11 @@ class ConfigManager:
         for p in (self.paths_json, self.usersettings_json, self.legacy_json):
             if not p.exists():
                 p.write_text("{}", encoding="utf-8")
+        self.watch_interval = watch_interval
+        self._lock = threading.RLock()
+        self._dirty = False; self._batch_depth = 0
+        self._resolver = None
+        self._reload()
 
     def _load_json(self, p: Path):
         try:
@@ -19,47 +37,87 @@ class ConfigManager:
         except Exception:
             return {}
 
-    def _load_all(self):
+    def _stamps(self):
+        out = []
+        for p in (self.legacy_json, self.paths_json, self.usersettings_json):
+            try: st = p.stat(); out.append((st.st_mtime_ns, st.st_size))
+            except OSError: out.append(None)
+        return out
+
+    def _reload(self):
+        self._legacy = self._load_json(self.legacy_json)
         data = {}
-        data.update(self._load_json(self.legacy_json))
+        data.update(self._legacy)
         data.update(self._load_json(self.paths_json))
         data.update(self._load_json(self.usersettings_json))
-        return data
+        self._data = data
+        self._stamp = self._stamps(); self._checked = time.monotonic()
+
+    def _maybe_reload(self):
+        if not self.watch_interval or self._dirty: return
+        if time.monotonic() - self._checked < self.watch_interval: return
+        with self._lock:
+            self._checked = time.monotonic()
+            if self._stamps() != self._stamp:
+                self._reload()
+
+    def _load_all(self):
+        self._maybe_reload()
+        return dict(self._data)
 
     def load_user_setting(self, key: str, default=None):
-        return self._load_all().get(key, default)
+        self._maybe_reload()
+        return self._data.get(key, default)
 
     def save_user_setting(self, key: str, value):
-        allv = self._load_all(); allv[key] = value
-        filtered = {k: allv.get(k,"") for k in ["charges_path","tenants_path","frais_path","si_path","output_dir"]}
-        self.paths_json.write_text(json.dumps(filtered, ensure_ascii=False, indent=2), encoding="utf-8")
-        self.usersettings_json.write_text(json.dumps(filtered, ensure_ascii=False, indent=2), encoding="utf-8")
-        legacy = self._load_json(self.legacy_json); legacy[key] = value
-        self.legacy_json.write_text(json.dumps(legacy, ensure_ascii=False, indent=2), encoding="utf-8")
+        with self._lock:
+            self._data[key] = value; self._legacy[key] = value
+            self._dirty = True
+            if key in ("path_rewrites", "path_cache_ttl"): self._resolver = None
+            if not self._batch_depth:
+                self.flush()
+
+    @contextmanager
+    def batch(self):
+        """Regroupe plusieurs save_user_setting en une seule écriture des trois fichiers."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flush()
+
+    def _write_atomic(self, p: Path, obj):
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty: return
+            filtered = {k: self._data.get(k,"") for k in self.PATH_KEYS}
+            self._write_atomic(self.paths_json, filtered)
+            self._write_atomic(self.usersettings_json, filtered)
+            self._write_atomic(self.legacy_json, self._legacy)
+            self._dirty = False
+            self._stamp = self._stamps(); self._checked = time.monotonic()
+
+    @property
+    def resolver(self) -> PathResolver:
+        if self._resolver is None:
+            self._resolver = PathResolver(rewrites=self.load_user_setting("path_rewrites"), ttl=float(self.load_user_setting("path_cache_ttl", 60) or 0))
+        return self._resolver
 
     def resolve_path(self, p: str) -> str:
         """
         Normalise en évitant les problèmes d'échappement:
         - Convertit d'abord les backslashes en slashes pour manipuler
-        - Tente la variante sans '.IS' dans C:/Users
+        - Tente les réécritures de 'path_rewrites' (défaut: variante sans '.IS' dans C:/Users)
         - Essaie versions en backslashes et slashes
         - Retourne le premier chemin existant, sinon une version backslash du chemin normalisé
+        Résultats mémorisés 'path_cache_ttl' secondes (voir resolver.stats()).
         """
-        if not p:
-            return ""
-        s = str(p)
-        s_norm = s.replace("\\", "/")
-        candidates = [s_norm]
-        if "C:/Users/a.thiebaud.IS" in s_norm:
-            candidates.append(s_norm.replace("C:/Users/a.thiebaud.IS", "C:/Users/a.thiebaud"))
-        # backslash variants
-        for c in list(candidates):
-            candidates.append(c.replace("/", "\\"))
-            candidates.append(c.replace("/", "\\"))
-        for c in candidates:
-            try:
-                if Path(c).exists():
-                    return c
-            except Exception:
-                pass
-        return s_norm.replace("/", "\\")
+        return self.resolver.resolve(p)
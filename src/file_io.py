@@ -1,17 +1,346 @@
-
+from __future__ import annotations
 from pathlib import Path
-import pandas as pd
+from collections import OrderedDict
+from contextlib import contextmanager
+import atexit
+import threading
+import time
+from src.lazy import LazyModule
+from src import instrument
+
+pd = LazyModule("pandas")
+
+class _Handle:
+    __slots__ = ("stamp", "xl", "refs", "lock", "used", "stale", "ready", "error")
+    def __init__(self, stamp, xl=None):
+        self.stamp = stamp; self.xl = xl; self.refs = 0; self.lock = threading.RLock(); self.used = time.monotonic(); self.stale = False
+        self.ready = threading.Event(); self.error = None
+
+class ExcelHandlePool:
+    """
+    Poignées pd.ExcelFile partagées, une par fichier, valides tant que (mtime, taille) ne changent pas.
+    - `with excel_pool.open(path) as xls:` prête la poignée (accès exclusif pendant le bloc, ExcelFile n'étant pas thread-safe).
+    - Au plus max_handles fichiers ouverts (LRU); une poignée inutilisée depuis idle_s secondes est fermée
+      par un minuteur, pour ne pas verrouiller le fichier (Windows/Excel) plus que nécessaire.
+    - Fichier modifié: l'ancienne poignée est fermée dès qu'elle n'est plus prêtée.
+    - invalidate(path) avant toute écriture du fichier; close_all() à la sortie du processus.
+    """
+    def __init__(self, max_handles: int = 8, idle_s: float = 10.0):
+        self.max_handles = max_handles
+        self.idle_s = idle_s
+        self._handles = OrderedDict()   # chemin résolu -> _Handle
+        self._lock = threading.Lock()
+        self._timer = None
+        self.stats = {"opened": 0, "reused": 0, "closed": 0}
+
+    @staticmethod
+    def _stamp(path: Path):
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _close(h: _Handle):
+        try:
+            if h.xl is not None: h.xl.close()
+        except Exception:
+            pass
+
+    def _acquire(self, path) -> _Handle:
+        """
+        Poignée prêtée (refs + 1). L'ouverture (lente sur un partage réseau / OneDrive) se fait hors du verrou du pool:
+        une entrée vide est publiée d'abord, les autres emprunteurs du même fichier attendent qu'elle soit prête.
+        """
+        key = str(Path(path).resolve()); stamp = self._stamp(Path(key))
+        to_close = []; opener = False
+        with self._lock:
+            h = self._handles.get(key)
+            if h is not None and h.stamp != stamp:
+                del self._handles[key]; h.stale = True
+                if h.refs == 0: to_close.append(h); self.stats["closed"] += 1
+                h = None
+            if h is not None:
+                self.stats["reused"] += 1
+            else:
+                h = _Handle(stamp); opener = True
+                self._handles[key] = h; self.stats["opened"] += 1
+            h.refs += 1; h.used = time.monotonic(); self._handles.move_to_end(key)
+            to_close += self._sweep()
+        for old in to_close: self._close(old)
+        if opener:
+            try:
+                with instrument.span("workbook.open", path=key):
+                    h.xl = pd.ExcelFile(key)
+            except BaseException as e:
+                h.error = e
+                with self._lock:
+                    if self._handles.get(key) is h: del self._handles[key]
+                    h.stale = True
+            finally:
+                h.ready.set()
+        else:
+            h.ready.wait()
+        if h.error is not None:
+            self._release(h)
+            raise h.error
+        return h
+
+    def _release(self, h: _Handle):
+        with self._lock:
+            h.refs -= 1; h.used = time.monotonic()
+            close = h.stale and h.refs == 0
+            if close: self.stats["closed"] += 1
+            elif h.refs == 0: self._schedule(self.idle_s)
+        if close: self._close(h)
+
+    def _schedule(self, delay: float):
+        """(Sous verrou) arme le minuteur de fermeture des poignées inactives s'il ne l'est pas déjà."""
+        if self._timer is not None: return
+        self._timer = threading.Timer(max(delay, 0.05), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            to_close = self._sweep()
+            now = time.monotonic()
+            idle = [h.used for h in self._handles.values() if h.refs == 0]
+            if idle: self._schedule(min(idle) + self.idle_s - now)
+        for h in to_close: self._close(h)
+
+    def _sweep(self) -> list:
+        """Retire (sous verrou) les poignées en trop ou inactives non prêtées; la fermeture se fait hors verrou."""
+        out, now = [], time.monotonic()
+        for key, h in list(self._handles.items()):
+            if h.refs or not h.ready.is_set(): continue
+            if len(self._handles) > self.max_handles or now - h.used > self.idle_s:
+                del self._handles[key]; out.append(h); self.stats["closed"] += 1
+        return out
+
+    @contextmanager
+    def open(self, path):
+        """Prête la poignée du fichier (ouverte si besoin) pour la durée du bloc; ne pas la fermer soi-même."""
+        h = self._acquire(path)
+        try:
+            with h.lock:
+                yield h.xl
+        finally:
+            self._release(h)
+
+    def invalidate(self, path=None):
+        """Oublie la poignée du fichier (toutes si path=None); elle est fermée dès qu'elle n'est plus prêtée."""
+        to_close = []
+        with self._lock:
+            keys = list(self._handles) if path is None else [str(Path(path).resolve())]
+            for key in keys:
+                h = self._handles.pop(key, None)
+                if h is None: continue
+                h.stale = True
+                if h.refs == 0: to_close.append(h); self.stats["closed"] += 1
+        for h in to_close: self._close(h)
+
+    def close_all(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None: timer.cancel()
+        self.invalidate(None)
+
+    def __len__(self):
+        return len(self._handles)
+
+excel_pool = ExcelHandlePool()
+atexit.register(excel_pool.close_all)
 
 class DataLoader:
     def __init__(self, config_mgr):
         self.config_mgr = config_mgr
 
+    @contextmanager
     def excel_file(self, path: Path):
+        """
+        `with loader.excel_file(path) as xls:` poignée partagée du pool, en accès exclusif pendant le bloc
+        (None si le fichier n'existe pas). Ne pas la fermer ni la conserver après le bloc.
+        """
         path = Path(path) if path else None
-        if not path or not path.exists(): return None
-        return pd.ExcelFile(path)
+        if not path or not path.exists():
+            yield None
+            return
+        with excel_pool.open(path) as xls:
+            yield xls
+
+    def read_df(self, path: Path, sheet: str, columns=None, rows=None, downcast: bool = False):
+        """
+        Feuille entière par défaut. Avec columns / rows ("last" ou n dernières lignes) / downcast,
+        lecture en flux allégée via read_sheet.
+        """
+        if columns is not None or rows is not None or downcast:
+            if not path or not Path(path).exists(): return None
+            with instrument.span("loader.stream", sheet=sheet):
+                return read_sheet(path, sheet, columns=columns, rows=rows, downcast=downcast)
+        if not path or not Path(path).exists(): return None
+        with excel_pool.open(path) as xls:
+            if sheet not in xls.sheet_names: return None
+            with instrument.span("loader.parse", sheet=sheet):
+                return xls.parse(sheet)
+
+def _header_names(header) -> list:
+    """Noms de colonnes comme pandas: cellule vide -> 'Unnamed: i', doublons -> 'X.1', 'X.2'..."""
+    names, seen = [], {}
+    for i, h in enumerate(header):
+        name = f"Unnamed: {i}" if h is None or (isinstance(h, str) and not h.strip()) else h
+        if name in seen:
+            seen[name] += 1; name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _stream_sheet(path: Path, sheet: str, keep=None):
+    """
+    Parcourt la feuille en mode read_only sans la matérialiser, via la poignée du pool.
+    keep: None (toutes les lignes) ou n (n dernières lignes non vides).
+    Retourne (noms de colonnes, lignes conservées, indicateur 'colonne non vide' par colonne), ou None si feuille absente.
+    """
+    from collections import deque
+    # Classeur openpyxl (read_only, data_only) de la poignée partagée: pas de rechargement par feuille lue.
+    with excel_pool.open(path) as xls:
+        wb = xls.book
+        if sheet not in wb.sheetnames: return None
+        it = wb[sheet].iter_rows(values_only=True)
+        header = list(next(it, None) or [])
+        kept = deque(maxlen=keep) if keep is not None else []
+        pending = []  # lignes vides non encore suivies d'une ligne non vide (pandas ignore les lignes vides finales)
+        nonempty = [False]*len(header)
+        for row in it:
+            if all(v is None for v in row):
+                if keep is None: pending.append(row)
+                continue
+            if pending: kept.extend(pending); pending = []
+            if len(row) > len(nonempty): nonempty += [False]*(len(row)-len(nonempty))
+            for i, v in enumerate(row):
+                if v is not None: nonempty[i] = True
+            kept.append(row)
+    width = max(len(header), len(nonempty))
+    names = _header_names(header + [None]*(width-len(header)))
+    rows = [tuple(r) + (None,)*(width-len(r)) for r in kept]
+    return names, rows, nonempty + [False]*(width-len(nonempty))
+
+def _downcast_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """float64 -> float32 seulement si toutes les valeurs sont représentables exactement; texte répétitif -> category."""
+    import numpy as np
+    for c in df.columns:
+        col = df[c]
+        if pd.api.types.is_float_dtype(col.dtype) and col.dtype != np.float32:
+            f32 = col.astype(np.float32)
+            if np.array_equal(f32.astype(col.dtype).to_numpy(), col.to_numpy(), equal_nan=True): df[c] = f32
+        elif pd.api.types.is_integer_dtype(col.dtype):
+            df[c] = pd.to_numeric(col, downcast="integer")
+        elif (col.dtype == object or pd.api.types.is_string_dtype(col.dtype)) and len(col) >= 2 and col.nunique(dropna=True) <= len(col) // 2:
+            if col.map(lambda v: v is None or isinstance(v, str) or v != v).all(): df[c] = col.astype("category")
+    return df
+
+def read_sheet(path: Path, sheet: str, columns=None, rows=None, downcast: bool = False):
+    """
+    Lecture en flux (openpyxl read_only) d'une feuille, sans charger le classeur entier en mémoire.
+    - columns: colonnes à garder (les absentes sont ignorées); None: toutes, hors 'Unnamed' vides.
+    - rows: None (toutes), "last" (dernière ligne non vide) ou n (n dernières lignes).
+    - downcast: float32/entiers réduits/category lorsque c'est sans perte.
+    Retourne None si la feuille n'existe pas.
+    """
+    keep = 1 if rows == "last" else rows
+    res = _stream_sheet(path, sheet, keep=keep)
+    if res is None: return None
+    names, data, nonempty = res
+    idx = [i for i, n in enumerate(names) if not (isinstance(n, str) and n.startswith("Unnamed:") and not nonempty[i])]
+    if columns is not None:
+        wanted = set(columns); idx = [i for i in idx if names[i] in wanted]
+    df = _numeric_objects(pd.DataFrame([[r[i] for i in idx] for r in data], columns=[names[i] for i in idx]))
+    return _downcast_frame(df) if downcast else df
+
+def _prune_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Supprime les colonnes 'Unnamed: n' entièrement vides et convertit les colonnes objet purement numériques."""
+    drop = [c for c in df.columns if isinstance(c, str) and c.startswith("Unnamed:") and df[c].isna().all()]
+    if drop: df = df.drop(columns=drop)
+    return _numeric_objects(df)
+
+def _numeric_objects(df: pd.DataFrame) -> pd.DataFrame:
+    for c in df.columns[df.dtypes == object]:
+        try:
+            df[c] = pd.to_numeric(df[c])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+class WorkbookSnapshot:
+    """
+    Vue en lecture seule d'un classeur: chaque feuille est parsée au plus une fois.
+    Les DataFrames retournés sont partagés entre appelants: les copier avant de les modifier.
+    Avec un SheetCache, les feuilles déjà parsées lors d'une exécution précédente sont
+    relues depuis le disque et le classeur n'est ouvert qu'en cas d'absence du cache.
+    """
+    parse_calls = 0  # total des parse() effectifs, toutes instances confondues
+
+    def __init__(self, source, cache=None):
+        self.parse_count = 0
+        self._frames = {}
+        self._lean = {}
+        self._xl = source if isinstance(source, pd.ExcelFile) else None
+        self.path = None if self._xl is not None else Path(source)
+        self.cache = cache if self._xl is None else None
+        self._key = self.cache.key(self.path) if self.cache else None
+        with instrument.span("cache.read", sheet="__sheets__"):
+            names = self.cache.get(self._key, "__sheets__") if self._key else None
+        if names is None:
+            with self._excel() as xl:
+                names = list(xl.sheet_names)
+            if self._key: self.cache.put(self._key, "__sheets__", names)
+        self.sheet_names = names
+
+    @contextmanager
+    def _excel(self):
+        """ExcelFile fourni à la construction, sinon poignée prêtée par excel_pool."""
+        if self._xl is not None:
+            yield self._xl
+        else:
+            with excel_pool.open(self.path) as xl:
+                yield xl
+
+    def parse(self, sheet: str) -> pd.DataFrame:
+        if sheet not in self._frames:
+            with instrument.span("cache.read", sheet=sheet):
+                df = self.cache.get(self._key, sheet) if self._key else None
+            if df is None:
+                with instrument.span("sheet.parse", sheet=sheet), self._excel() as xl:
+                    df = _prune_frame(xl.parse(sheet))
+                self.parse_count += 1; WorkbookSnapshot.parse_calls += 1
+                if self._key: self.cache.put(self._key, sheet, df)
+            self._frames[sheet] = df
+        return self._frames[sheet]
+
+    def _last_and_columns(self, sheet: str):
+        """(colonnes, dernière ligne) sans matérialiser la feuille: lecture en flux si elle n'est pas déjà parsée."""
+        if sheet in self._frames or self.path is None:
+            df = self.parse(sheet)
+            return list(df.columns), (df.iloc[-1] if not df.empty else None)
+        if sheet not in self._lean:
+            name = f"{sheet}#last"
+            with instrument.span("cache.read", sheet=name):
+                res = self.cache.get(self._key, name) if self._key else None
+            if res is None:
+                with instrument.span("sheet.stream", sheet=sheet):
+                    df = read_sheet(self.path, sheet, rows="last")
+                self.parse_count += 1; WorkbookSnapshot.parse_calls += 1
+                res = (list(df.columns), df.iloc[-1] if not df.empty else None)
+                if self._key: self.cache.put(self._key, name, res)
+            self._lean[sheet] = res
+        return self._lean[sheet]
+
+    def last_row(self, sheet: str):
+        """Dernière ligne de la feuille (None si feuille absente ou vide)."""
+        if sheet not in self.sheet_names: return None
+        return self._last_and_columns(sheet)[1]
 
-    def read_df(self, path: Path, sheet: str):
-        xls = self.excel_file(path)
-        if not xls or sheet not in xls.sheet_names: return None
-        return xls.parse(sheet)
+    def columns(self, sheet: str) -> list:
+        """En-têtes de la feuille ([] si absente)."""
+        if sheet not in self.sheet_names: return []
+        return self._last_and_columns(sheet)[0]
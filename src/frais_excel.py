@@ -1,19 +1,49 @@
+import logging
+import sys
+from pathlib import Path
 import pandas as pd
 
+if __package__ in (None, ""):  # exécution directe: python src/frais_excel.py
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.file_io import excel_pool
+
 EXCEL_PATH = "assets/frais_divers_annuels.xlsx"
 
+logger = logging.getLogger(__name__)
+
+def _est_frais_divers(feuille):
+    return feuille.strip().lower() == "frais divers"
+
 def get_feuilles():
     """Retourne toutes les feuilles à traiter sauf 'frais divers' (insensible à la casse et espaces)."""
-    xls = pd.ExcelFile(EXCEL_PATH)
-    return [f for f in xls.sheet_names if f.strip().lower() != "frais divers"]
+    with excel_pool.open(EXCEL_PATH) as xls:
+        return [f for f in xls.sheet_names if not _est_frais_divers(f)]
 
 def lire_tous_les_frais():
-    """Retourne un dict {feuille: dataframe} pour toutes les feuilles (hors 'frais divers')."""
-    result = {}
-    for feuille in get_feuilles():
-        df = pd.read_excel(EXCEL_PATH, sheet_name=feuille)
-        result[feuille] = df
-    return result
+    """Retourne un dict {feuille: dataframe} pour toutes les feuilles (hors 'frais divers'), lues en une seule passe."""
+    with excel_pool.open(EXCEL_PATH) as xls:
+        return {f: xls.parse(f) for f in xls.sheet_names if not _est_frais_divers(f)}
+
+def _unifier_types(frames):
+    """
+    Aligne les colonnes de tous les DataFrames et leur donne un type commun avant concaténation.
+    Une colonne entière ou booléenne qui contient des vides dans au moins une feuille (ou y est absente)
+    est élargie en float64 / object: un cast direct lèverait (entiers) ou changerait NaN en True (booléens).
+    """
+    colonnes = list(dict.fromkeys(c for df in frames for c in df.columns))
+    cibles = {}
+    for c in colonnes:
+        types = {df[c].dtype for df in frames if c in df.columns and df[c].notna().any()}
+        vides = any(c not in df.columns or df[c].isna().any() for df in frames)
+        if types and all(pd.api.types.is_datetime64_any_dtype(t) for t in types):
+            cibles[c] = "datetime64[ns]"
+        elif len(types) == 1 and not (vides and (pd.api.types.is_integer_dtype(next(iter(types))) or pd.api.types.is_bool_dtype(next(iter(types))))):
+            cibles[c] = next(iter(types))
+        elif types and all(pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t) for t in types):
+            cibles[c] = "float64"
+        else:
+            cibles[c] = object
+    return [df.reindex(columns=colonnes).astype(cibles) for df in frames]
 
 def afficher_tous_les_frais():
     """Affiche tous les frais de chaque feuille dans la console (debug)."""
@@ -22,22 +52,97 @@ def afficher_tous_les_frais():
         print(f"\n--- {feuille} ---")
         print(df)
 
+class FraisSession:
+    """Session d'édition groupée du classeur de frais.
+
+    Chaque feuille touchée est lue une seule fois; les modifications sont appliquées en mémoire
+    et toutes les feuilles modifiées sont écrites en une seule sauvegarde du classeur
+    (à la sortie du bloc `with`, ou via commit()). En cas d'exception dans le bloc, rien n'est écrit.
+
+        with FraisSession() as s:
+            s.add("Entretien", {"Description": "...", "Montant (CHF)": 100})
+            s.modify("Entretien", 0, "Montant (CHF)", 120)
+    """
+    def __init__(self, path=None):
+        self.path = path or EXCEL_PATH
+        self._sheets = {}
+        self._pending = {}
+        self._dirty = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+        return False
+
+    def _lue(self, feuille):
+        """DataFrame de la feuille tel que lu (premier accès), sans les ajouts en attente."""
+        if feuille not in self._sheets:
+            with excel_pool.open(self.path) as xls:
+                if feuille not in xls.sheet_names:
+                    raise KeyError(f"Feuille introuvable: {feuille}")
+                self._sheets[feuille] = xls.parse(feuille)
+        return self._sheets[feuille]
+
+    def sheet(self, feuille):
+        """DataFrame de la feuille (lue au premier accès), modifications en attente incluses."""
+        self._lue(feuille)
+        rows = self._pending.pop(feuille, None)
+        if rows:
+            self._sheets[feuille] = pd.concat([self._sheets[feuille], pd.DataFrame(rows)], ignore_index=True)
+        return self._sheets[feuille]
+
+    def _check_columns(self, feuille, colonnes):
+        df = self._lue(feuille)  # les ajouts ne créent pas de colonne: inutile de les concaténer ici
+        if len(df.columns) == 0: return
+        inconnues = [c for c in colonnes if c not in df.columns]
+        if inconnues:
+            raise ValueError(f"Colonnes inconnues dans la feuille '{feuille}': {inconnues} (attendues: {list(df.columns)})")
+
+    def add(self, feuille, valeurs_dict):
+        """Ajoute une ligne (les colonnes doivent exister dans la feuille); concaténée une seule fois, à la lecture ou au commit."""
+        self._check_columns(feuille, valeurs_dict.keys())
+        self._pending.setdefault(feuille, []).append(dict(valeurs_dict))
+        self._dirty.add(feuille)
+
+    def modify(self, feuille, index_ligne, colonne, nouvelle_valeur):
+        """Modifie une valeur existante (ligne et colonne doivent exister)."""
+        self._check_columns(feuille, [colonne])
+        df = self.sheet(feuille)
+        if index_ligne not in df.index:
+            raise IndexError(f"Ligne {index_ligne} inexistante dans la feuille '{feuille}' ({len(df)} lignes)")
+        df.at[index_ligne, colonne] = nouvelle_valeur
+        self._dirty.add(feuille)
+
+    def close(self):
+        """Libère la poignée du classeur (partagée via excel_pool) pour qu'il puisse être réécrit ou ouvert dans Excel."""
+        excel_pool.invalidate(self.path)
+
+    def commit(self):
+        """Écrit toutes les feuilles modifiées en une seule sauvegarde."""
+        if not self._dirty: return
+        frames = {f: self.sheet(f) for f in self._dirty}
+        self.close()
+        with pd.ExcelWriter(self.path, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
+            for feuille, df in frames.items():
+                df.to_excel(writer, sheet_name=feuille, index=False)
+        self._dirty.clear()
+
 def ajouter_frais(feuille, valeurs_dict):
     """Ajoute une ligne de frais dans la feuille donnée.
-    valeurs_dict: dict des colonnes/valeurs, ex: {"Description": "...", "montant (CHF)": 100}
+    valeurs_dict: dict des colonnes/valeurs, ex: {"Description": "...", "Montant (CHF)": 100}
+    Pour plusieurs lignes, préférer FraisSession (une seule écriture).
     """
-    df = pd.read_excel(EXCEL_PATH, sheet_name=feuille)
-    new_row = pd.DataFrame([valeurs_dict])
-    df = pd.concat([df, new_row], ignore_index=True)
-    with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
-        df.to_excel(writer, sheet_name=feuille, index=False)
+    with FraisSession() as s:
+        s.add(feuille, valeurs_dict)
 
 def modifier_frais(feuille, index_ligne, colonne, nouvelle_valeur):
     """Modifie une valeur existante dans une feuille."""
-    df = pd.read_excel(EXCEL_PATH, sheet_name=feuille)
-    df.at[index_ligne, colonne] = nouvelle_valeur
-    with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
-        df.to_excel(writer, sheet_name=feuille, index=False)
+    with FraisSession() as s:
+        s.modify(feuille, index_ligne, colonne, nouvelle_valeur)
 
 def regrouper_frais_vers_frais_divers(tri=None, ordre='asc'):
     """Regroupe toutes les lignes des autres feuilles dans l'onglet 'frais divers'.
@@ -54,14 +159,13 @@ def regrouper_frais_vers_frais_divers(tri=None, ordre='asc'):
     - Ajoute une colonne 'Groupe' indiquant la provenance.
     - Ne fait aucun regroupement/somme: chaque ligne originale est gardée telle quelle.
     - Si colonne 'Date' présente, elle est tentée en conversion datetime pour un tri fiable.
+    - Le classeur est lu en une seule passe; la progression est journalisée (logger du module).
     """
-    feuilles = get_feuilles()
-    print("Feuilles détectées :", feuilles)
+    frais = lire_tous_les_frais()
+    logger.info("Feuilles détectées : %s", list(frais))
     frames = []
-    for feuille in feuilles:
-        print(f"Lecture de la feuille : {feuille}")
-        df = pd.read_excel(EXCEL_PATH, sheet_name=feuille)
-        print(df)
+    for feuille, df in frais.items():
+        logger.debug("Feuille %s : %d lignes", feuille, len(df))
         if df.empty:
             continue
         df = df.copy()
@@ -77,14 +181,14 @@ def regrouper_frais_vers_frais_divers(tri=None, ordre='asc'):
     if not frames:
         colonnes_min = ["Description", "montant (CHF)", "Groupe"]
         vide = pd.DataFrame(columns=colonnes_min)
+        excel_pool.invalidate(EXCEL_PATH)
         with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
             vide.to_excel(writer, sheet_name='frais divers', index=False)
-        print("Aucune donnée à regrouper. Feuille 'frais divers' recréée vide.")
+        logger.warning("Aucune donnée à regrouper. Feuille 'frais divers' recréée vide.")
         return
 
-    frais_divers = pd.concat(frames, ignore_index=True)
-    print("Résultat final :")
-    print(frais_divers)
+    frais_divers = pd.concat(_unifier_types(frames), ignore_index=True)
+    logger.debug("Résultat final : %d lignes, colonnes %s", len(frais_divers), list(frais_divers.columns))
 
     # Application du tri si demandé
     if tri:
@@ -95,26 +199,29 @@ def regrouper_frais_vers_frais_divers(tri=None, ordre='asc'):
             try:
                 frais_divers = frais_divers.sort_values(by=by_valides, ascending=asc, kind='stable')
             except Exception as e:
-                print(f"Tri ignoré (erreur: {e})")
+                logger.warning("Tri ignoré (erreur: %s)", e)
         else:
-            print("Colonnes de tri inexistantes, tri ignoré.")
+            logger.warning("Colonnes de tri inexistantes, tri ignoré.")
 
+    excel_pool.invalidate(EXCEL_PATH)
     with pd.ExcelWriter(EXCEL_PATH, engine="openpyxl", mode='a', if_sheet_exists='replace') as writer:
         frais_divers.to_excel(writer, sheet_name='frais divers', index=False)
 
-    print(f"{len(frais_divers)} lignes écrites dans la feuille 'frais divers'.")
-    if tri:
-        print(f"Tri appliqué sur: {by_valides} (ordre {'ascendant' if asc else 'descendant'}).")
+    logger.info("%d lignes écrites dans la feuille 'frais divers'.", len(frais_divers))
+    if tri and by_valides:
+        logger.info("Tri appliqué sur: %s (ordre %s).", by_valides, 'ascendant' if asc else 'descendant')
 
 def lire_frais_divers():
     """Lit la feuille 'frais divers' (après regroupement). Retourne un DataFrame ou None si erreur."""
     try:
-        return pd.read_excel(EXCEL_PATH, sheet_name='frais divers')
+        with excel_pool.open(EXCEL_PATH) as xls:
+            return xls.parse('frais divers')
     except Exception as e:
-        print(f"Impossible de lire la feuille 'frais divers': {e}")
+        logger.error("Impossible de lire la feuille 'frais divers': %s", e)
         return None
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
     # Exemple d'utilisation rapide avec tri par Groupe puis Date si existant
     regrouper_frais_vers_frais_divers(tri=["Groupe", "Date"], ordre='asc')
     print(lire_frais_divers())
@@ -0,0 +1,114 @@
+from __future__ import annotations
+from pathlib import Path
+import datetime
+import os
+import sqlite3
+from src.lazy import LazyModule
+from src.file_io import excel_pool
+
+pd = LazyModule("pandas")
+
+HISTORY_COLUMNS = ["Appartement","Chauffage_kWh","Refroid_kWh","Eau_froide_m3","Eau_chaude_m3","Montant_eau","Montant_energie","Total_CHF"]
+_VALUE_COLUMNS = HISTORY_COLUMNS[1:]
+
+def period_year(period_label: str) -> str:
+    return period_label.split("-")[0] if "-" in period_label else str(datetime.date.today().year)
+
+class HistoryStore:
+    """
+    Historique des factures en SQLite (une ligne par appartement, période et immeuble).
+    - record() remplace les lignes d'une période/immeuble en une transaction: réexporter une période ne duplique rien.
+    - L'xlsx 'Historique_factures_{année}' n'est qu'une vue, matérialisée à la demande par export_xlsx().
+    """
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path); self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        cols = ", ".join(f'"{c}" REAL' for c in _VALUE_COLUMNS)
+        con = self._connect()
+        try:
+            with con:
+                con.execute(f"CREATE TABLE IF NOT EXISTS factures (periode TEXT NOT NULL, annee TEXT NOT NULL, immeuble TEXT NOT NULL DEFAULT '', appartement TEXT NOT NULL, {cols}, enregistre_le TEXT)")
+                con.execute("CREATE INDEX IF NOT EXISTS ix_factures_periode ON factures(periode, immeuble)")
+                con.execute("CREATE INDEX IF NOT EXISTS ix_factures_appartement ON factures(appartement, periode)")
+                con.execute("CREATE INDEX IF NOT EXISTS ix_factures_annee ON factures(annee)")
+        finally:
+            con.close()
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def record(self, period_label: str, rep_df: pd.DataFrame, building: str = "") -> int:
+        """Enregistre (ou remplace) les lignes de rep_df pour la période et l'immeuble donnés."""
+        df = rep_df.reindex(columns=HISTORY_COLUMNS)
+        now = datetime.datetime.now().isoformat(timespec="seconds"); year = period_year(period_label)
+        rows = [(period_label, year, building or "", "" if pd.isna(r[0]) else str(r[0]), *[None if pd.isna(v) else float(v) for v in r[1:]], now)
+                for r in df.itertuples(index=False, name=None)]
+        cols = ", ".join(f'"{c}"' for c in _VALUE_COLUMNS)
+        marks = ", ".join("?" for _ in range(len(_VALUE_COLUMNS) + 5))
+        con = self._connect()
+        try:
+            with con:
+                con.execute("DELETE FROM factures WHERE periode = ? AND immeuble = ?", (period_label, building or ""))
+                con.executemany(f"INSERT INTO factures (periode, annee, immeuble, appartement, {cols}, enregistre_le) VALUES ({marks})", rows)
+        finally:
+            con.close()
+        return len(rows)
+
+    def query(self, apartment: str = None, period: str = None, year: str = None, building: str = None) -> pd.DataFrame:
+        """Lignes d'historique filtrées (index SQLite sur appartement, période et année), colonnes au format du log xlsx."""
+        where, params = [], []
+        for col, val in (("appartement", apartment), ("periode", period), ("annee", year), ("immeuble", building)):
+            if val is not None: where.append(f"{col} = ?"); params.append(str(val))
+        cols = ", ".join(f'"{c}"' for c in _VALUE_COLUMNS)
+        sql = f'SELECT appartement AS "Appartement", {cols}, periode AS "Période", immeuble AS "Immeuble" FROM factures'
+        if where: sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY rowid"
+        con = self._connect()
+        try:
+            df = pd.read_sql_query(sql, con, params=params)
+        finally:
+            con.close()
+        if not df.empty and (df["Immeuble"] == "").all(): df = df.drop(columns=["Immeuble"])
+        return df
+
+    def has_year(self, year: str) -> bool:
+        con = self._connect()
+        try:
+            return con.execute("SELECT 1 FROM factures WHERE annee = ? LIMIT 1", (str(year),)).fetchone() is not None
+        finally:
+            con.close()
+
+    def years(self) -> list:
+        con = self._connect()
+        try:
+            return [r[0] for r in con.execute("SELECT DISTINCT annee FROM factures ORDER BY annee")]
+        finally:
+            con.close()
+
+    def import_xlsx(self, log_path: Path, building: str = "") -> int:
+        """Reprend un ancien Historique_factures_{année}.xlsx (une période par valeur de 'Période')."""
+        try:
+            with excel_pool.open(log_path) as xls:
+                log_df = xls.parse(0)
+        except Exception:
+            return 0
+        if log_df.empty or "Période" not in log_df.columns: return 0
+        n = 0
+        for period, grp in log_df.groupby(log_df["Période"].astype(str), sort=False):
+            n += self.record(period, grp, building=building)
+        return n
+
+    def export_xlsx(self, log_path: Path, year: str = None) -> str:
+        """Matérialise la vue xlsx (écriture dans un fichier temporaire puis renommage atomique)."""
+        log_path = Path(log_path)
+        df = self.query(year=year)
+        tmp = log_path.with_name(f"~{log_path.stem}.{os.getpid()}.tmp.xlsx")
+        try:
+            with pd.ExcelWriter(tmp, engine="openpyxl") as wr:
+                df.to_excel(wr, index=False, sheet_name="Log")
+            excel_pool.invalidate(log_path)
+            os.replace(tmp, log_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return str(log_path)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+from pathlib import Path
+import hashlib
+import pickle
+from src.lazy import LazyModule
+from src import instrument
+from src.app_logic import (SI_COLUMNS, _apartment_amounts, _consumption_matrix, _details_frame, _details_text,
+                           _energy_rows, _kwh_from_row, _price_ec_from, _prices_from_si, _repartition_frame, _row_sum, _si_row,
+                           _water_from_rows, _weighted_kwh_price)
+
+pd = LazyModule("pandas")
+
+INPUT_SHEETS = ("Eau Froide", "Eau Chaude", "Chauffage", "Refroidissement", "PAC", "Communs", "Frais Eau")
+
+def _fingerprint(value) -> bytes:
+    try:
+        return hashlib.sha1(pickle.dumps(value, protocol=4)).digest()
+    except Exception:
+        return hashlib.sha1(repr(value).encode("utf-8", "replace")).digest()
+
+def _file_stamp(path):
+    try:
+        st = Path(path).stat()
+    except (OSError, TypeError):
+        return None
+    return (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+
+class DependencyGraph:
+    """
+    Graphe de calcul mémoïsé.
+    - set_input(nom, valeur): la version de l'entrée n'augmente que si son empreinte change.
+    - add(nom, deps, fn): nœud dérivé fn(*valeurs des deps), recalculé seulement si une dépendance a changé de version.
+      Un nœud recalculé dont la valeur est identique garde sa version (ses dépendants ne sont pas recalculés).
+    - recomputed: nœuds recalculés depuis le dernier reset_stats().
+    """
+    def __init__(self):
+        self._inputs = {}   # nom -> [valeur, empreinte, version]
+        self._nodes = {}    # nom -> (deps, fn)
+        self._memo = {}     # nom -> [valeur, empreinte, version, versions des deps]
+        self.recomputed = []
+
+    def set_input(self, name: str, value) -> bool:
+        fp = _fingerprint(value); cur = self._inputs.get(name)
+        if cur is not None and cur[1] == fp: return False
+        self._inputs[name] = [value, fp, (cur[2] + 1) if cur else 1]
+        return True
+
+    def add(self, name: str, deps, fn):
+        self._nodes[name] = (tuple(deps), fn); self._memo.pop(name, None)
+
+    def version(self, name: str) -> int:
+        if name in self._inputs: return self._inputs[name][2]
+        self.get(name)
+        return self._memo[name][2]
+
+    def get(self, name: str):
+        if name in self._inputs: return self._inputs[name][0]
+        if name not in self._nodes: raise KeyError(f"Nœud inconnu: {name}")
+        deps, fn = self._nodes[name]
+        dep_versions = tuple(self.version(d) for d in deps)
+        memo = self._memo.get(name)
+        if memo is not None and memo[3] == dep_versions: return memo[0]
+        value = fn(*(self.get(d) for d in deps)); fp = _fingerprint(value)
+        self.recomputed.append(name)
+        if memo is None: version = 1
+        else: version = memo[2] if memo[1] == fp else memo[2] + 1
+        self._memo[name] = [value, fp, version, dep_versions]
+        return value
+
+    def reset_stats(self):
+        self.recomputed = []
+
+def _prices_node(*si_values):
+    return _prices_from_si({c: v for c, v in zip(SI_COLUMNS, si_values) if v is not None})
+
+def _water_node(base: dict, si_prices) -> dict:
+    water = dict(base); si_water = si_prices[0]
+    for k in ["price_ef","price_ec","price_eu"]:
+        if (water.get(k) or 0)==0 and (si_water.get(k) or 0)>0: water[k] = si_water[k]
+    return water
+
+def _price_ec_node(water: dict, price_global_real: float, pac: tuple, ch_last, rf_last, ec_last) -> float:
+    price_ef = float(water.get("price_ef",0) or 0)
+    try:
+        return _price_ec_from(price_ef, float(price_global_real or 0), sum(pac), _row_sum(ch_last), _row_sum(rf_last), _row_sum(ec_last))
+    except Exception:
+        return price_ef
+
+def _leaf_key(values) -> tuple:
+    return tuple("nan" if v != v else v for v in values)
+
+class IncrementalBilling:
+    """
+    Recalcul incrémental de build_repartitions pour un immeuble.
+
+    Entrées: dernière ligne de chaque feuille de charges (INPUT_SHEETS) et chaque colonne SI (SI_COLUMNS).
+    Nœuds mémoïsés: prix SI, kWh PAC/Communs, eau, price_global_real, price_pac, price_ec.
+    Feuilles: montants par appartement, recalculés seulement si les relevés de l'appartement ou un prix ont changé.
+    Un fichier dont (mtime, taille) n'a pas bougé n'est pas relu.
+
+        inc = IncrementalBilling(engine)
+        rep_df, details_df, details_text = inc.update(charges_path, tenants_df)
+        ...  # correction d'un relevé
+        rep_df, details_df, details_text = inc.update(charges_path, tenants_df)
+        inc.changes             # diff_repartitions(ancien, nouveau)
+        inc.changed_apartments  # factures à régénérer
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.graph = DependencyGraph()
+        self._stamps = {}
+        self._xl = None
+        self._inferred = None
+        self._leaves = {}        # appartement -> (clé relevés+prix, ligne de montants)
+        self.rep_df = None
+        self.changes = None
+        self.changed_apartments = []
+        self.stats = {}
+        g = self.graph
+        g.add("si_prices", [f"si:{c}" for c in SI_COLUMNS], _prices_node)
+        g.add("kwh_pac", ["sheet:PAC"], _kwh_from_row)
+        g.add("kwh_com", ["sheet:Communs"], _kwh_from_row)
+        g.add("water_base", ["sheet:Eau Froide", "sheet:Eau Chaude", "sheet:Frais Eau"], _water_from_rows)
+        g.add("water_si", ["water_base", "si_prices"], _water_node)
+        g.add("price_global_real", ["si_prices", "kwh_pac", "kwh_com"], lambda p, a, b: _weighted_kwh_price(a[0]+b[0], a[1]+b[1], a[2]+b[2], p[1]))
+        g.add("price_pac", ["si_prices", "kwh_pac"], lambda p, a: _weighted_kwh_price(*a, p[1]))
+        g.add("price_ec", ["water_si", "price_global_real", "kwh_pac", "sheet:Chauffage", "sheet:Refroidissement", "sheet:Eau Chaude"], _price_ec_node)
+        g.add("energy", ["si_prices", "price_global_real", "price_pac"], lambda p, real, pac: {**p[1], "price_global_real": real, "price_pac": pac})
+        g.add("water", ["water_si", "price_ec"], lambda w, ec: {**w, "price_ec": ec})
+        g.add("energy_rows", ["kwh_pac", "kwh_com", "energy"], _energy_rows)
+        g.add("details_df", ["energy", "water", "kwh_pac", "kwh_com"], _details_frame)
+        g.add("details_text", ["kwh_pac", "kwh_com"], _details_text)
+
+    def _load_charges(self, charges_path) -> bool:
+        stamp = _file_stamp(charges_path)
+        if self._xl is not None and stamp is not None and self._stamps.get("charges") == stamp: return False
+        self._xl = xl = self.engine._snapshot(charges_path)
+        with instrument.span("incremental.inputs", source="charges"):
+            for sh in INPUT_SHEETS:
+                self.graph.set_input(f"sheet:{sh}", xl.last_row(sh) if sh in xl.sheet_names else None)
+        self._stamps["charges"] = stamp
+        return True
+
+    def _load_si(self, si_path):
+        stamp = _file_stamp(si_path) if si_path else None
+        if stamp is not None and self._stamps.get("si") == stamp: return
+        with instrument.span("incremental.inputs", source="si"):
+            try:
+                row = _si_row(Path(si_path) if si_path else None, cache=self.engine.cache)
+            except Exception:
+                row = {}
+            for c in SI_COLUMNS: self.graph.set_input(f"si:{c}", row.get(c))
+        self._stamps["si"] = stamp
+
+    def _amounts(self, cons: pd.DataFrame, water: dict, energy: dict) -> pd.DataFrame:
+        price_key = _leaf_key([water["price_ef"], water["price_ec"], water["price_eu"], energy["price_pac"]])
+        keys = [_leaf_key(v) + price_key for v in cons.itertuples(index=False, name=None)]
+        stale = [i for i, (apt, key) in enumerate(zip(cons.index, keys)) if self._leaves.get(apt, (None,))[0] != key]
+        if stale:
+            fresh = _apartment_amounts(cons.iloc[stale], water, energy).to_dict("records")
+            for i, rec in zip(stale, fresh): self._leaves[cons.index[i]] = (keys[i], rec)
+        self.stats["apartments_recomputed"] = len(stale)
+        return pd.DataFrame([self._leaves[apt][1] for apt in cons.index])
+
+    @instrument.timed("incremental.update")
+    def update(self, charges_path: Path, tenants_df: pd.DataFrame = None, si_path: Path = None):
+        """Même résultat que engine.build_repartitions(charges_path, tenants_df, si_path), en ne recalculant que le nécessaire."""
+        g = self.graph; g.reset_stats()
+        if si_path is None: si_path = self.engine.config.load_user_setting("si_path","")
+        charges_changed = self._load_charges(charges_path)
+        self._load_si(si_path)
+        energy = g.get("energy"); water = g.get("water")
+        rows = g.get("energy_rows")
+        if tenants_df is not None and not tenants_df.empty and "Appartement" in tenants_df.columns:
+            apts = list(tenants_df["Appartement"])
+        else:
+            if charges_changed or self._inferred is None: self._inferred = self.engine._infer_tenants_from_charges(self._xl)
+            apts = self._inferred
+        amounts = None; self.stats["apartments_recomputed"] = 0
+        if apts:
+            with instrument.span("compute.repartition", apartments=len(apts)):
+                amounts = self._amounts(_consumption_matrix(self._xl, apts), water, energy)
+        rep_df = _repartition_frame(rows, amounts)
+        self.changes = diff_repartitions(self.rep_df, rep_df) if self.rep_df is not None else None
+        self.changed_apartments = (list(rep_df["Appartement"]) if self.changes is None or rep_df.empty else
+                                   [a for a in dict.fromkeys(self.changes["Appartement"]) if a in set(rep_df["Appartement"])])
+        self.rep_df = rep_df
+        self.stats["nodes_recomputed"] = list(g.recomputed)
+        return rep_df, g.get("details_df"), g.get("details_text")
+
+def diff_repartitions(old: pd.DataFrame, new: pd.DataFrame, key: str = "Appartement", tol: float = 0.005) -> pd.DataFrame:
+    """
+    Différences entre deux rep_df: une ligne par (appartement, colonne) modifiée, avec Avant/Après/Écart.
+    Les appartements ajoutés ou retirés apparaissent avec Colonne = '(ajouté)' / '(retiré)'.
+    Les écarts numériques inférieurs ou égaux à tol sont ignorés.
+    """
+    cols_out = [key, "Colonne", "Avant", "Après", "Écart"]
+    old = old if old is not None else pd.DataFrame(columns=[key])
+    new = new if new is not None else pd.DataFrame(columns=[key])
+    o = old.drop_duplicates(key, keep="last").set_index(key)
+    n = new.drop_duplicates(key, keep="last").set_index(key)
+    out = []
+    for apt in n.index.difference(o.index, sort=False):
+        out.append({key: apt, "Colonne": "(ajouté)", "Avant": None, "Après": n.at[apt, "Total_CHF"] if "Total_CHF" in n.columns else None, "Écart": None})
+    for apt in o.index.difference(n.index, sort=False):
+        out.append({key: apt, "Colonne": "(retiré)", "Avant": o.at[apt, "Total_CHF"] if "Total_CHF" in o.columns else None, "Après": None, "Écart": None})
+    common = n.index[n.index.isin(o.index)]
+    for col in [c for c in n.columns if c in o.columns]:
+        a = o.loc[common, col]; b = n.loc[common, col]
+        an = pd.to_numeric(a, errors="coerce"); bn = pd.to_numeric(b, errors="coerce")
+        numeric = an.notna() & bn.notna()
+        same = (numeric & ((an - bn).abs() <= tol)) | (~numeric & ((a == b) | (a.isna() & b.isna())))
+        for apt in common[~same.to_numpy()]:
+            ecart = float(bn[apt] - an[apt]) if numeric[apt] else None
+            out.append({key: apt, "Colonne": col, "Avant": a[apt], "Après": b[apt], "Écart": ecart})
+    return pd.DataFrame(out, columns=cols_out)
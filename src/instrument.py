@@ -0,0 +1,140 @@
+from pathlib import Path
+from contextlib import contextmanager
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_MODE = "PERPLEXITY_PROFILE"      # "", "timing" (ou "1"), "cprofile", "pyinstrument"
+ENV_DIR = "PERPLEXITY_PROFILE_DIR"   # dossier du rapport (défaut: dossier courant)
+MODES = ("timing", "cprofile", "pyinstrument")
+
+_lock = threading.Lock()
+_local = threading.local()
+_state = {"mode": None, "spans": [], "profiler": None, "atexit": False, "out_dir": None}
+
+def _normalize(mode):
+    mode = str(mode or "").strip().lower()
+    if mode in ("1", "true", "on", "yes"): return "timing"
+    return mode if mode in MODES else None
+
+def configure(mode=None, config=None, out_dir=None):
+    """
+    Active l'instrumentation: mode explicite, sinon variable PERPLEXITY_PROFILE, sinon réglage 'profile_mode'.
+    En mode cprofile/pyinstrument, le profileur démarre immédiatement. Le rapport est écrit à la sortie du processus.
+    """
+    if mode is None: mode = os.environ.get(ENV_MODE)
+    if mode is None and config is not None: mode = config.load_user_setting("profile_mode", "")
+    mode = _normalize(mode)
+    with _lock:
+        if mode == _state["mode"]: return mode
+        _state["mode"] = mode
+        _state["out_dir"] = Path(out_dir or os.environ.get(ENV_DIR) or ".")
+        if mode in ("cprofile", "pyinstrument") and _state["profiler"] is None:
+            _state["profiler"] = _start_profiler(mode)
+        if mode and not _state["atexit"]:
+            atexit.register(_write_at_exit); _state["atexit"] = True
+    return mode
+
+def enabled() -> bool:
+    return _state["mode"] is not None
+
+def record(name: str, seconds: float, **attrs):
+    """Ajoute une mesure déjà chronométrée (ex. rendu dans un processus fils)."""
+    if _state["mode"] is None: return
+    with _lock:
+        _state["spans"].append({"name": name, "start": None, "seconds": seconds, "depth": len(getattr(_local, "stack", [])), "thread": threading.current_thread().name, **attrs})
+
+@contextmanager
+def span(name: str, **attrs):
+    """Chronomètre un bloc si l'instrumentation est active (coût quasi nul sinon)."""
+    if _state["mode"] is None:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None: stack = _local.stack = []
+    stack.append(name); t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0; stack.pop()
+        with _lock:
+            _state["spans"].append({"name": name, "start": t0, "seconds": dt, "depth": len(stack), "thread": threading.current_thread().name, **attrs})
+
+def timed(name: str):
+    """Décorateur: span(name) autour de chaque appel."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _state["mode"] is None: return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def reset():
+    with _lock:
+        _state["spans"] = []
+
+def report() -> dict:
+    """Mesures brutes et agrégats par étape (nombre, total, max)."""
+    with _lock:
+        spans = list(_state["spans"])
+    stages = {}
+    for s in spans:
+        st = stages.setdefault(s["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        st["count"] += 1; st["total_s"] += s["seconds"]; st["max_s"] = max(st["max_s"], s["seconds"])
+    return {"mode": _state["mode"], "stages": stages, "spans": spans}
+
+def summary_table(rep: dict = None) -> str:
+    rep = rep or report()
+    head = f"{'étape':<32} {'appels':>7} {'total (s)':>10} {'max (s)':>9}"
+    lines = [head, "-"*len(head)]
+    for name, st in sorted(rep["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        lines.append(f"{name:<32} {st['count']:>7} {st['total_s']:>10.3f} {st['max_s']:>9.3f}")
+    return "\n".join(lines)
+
+def write_report(out_dir: Path = None) -> Path:
+    """Écrit perplexity_timing.json (et le profil si un profileur tourne); retourne le chemin du JSON."""
+    out_dir = Path(out_dir or _state["out_dir"] or "."); out_dir.mkdir(parents=True, exist_ok=True)
+    fp = out_dir / "perplexity_timing.json"
+    fp.write_text(json.dumps(report(), ensure_ascii=False, indent=2), encoding="utf-8")
+    prof = _state["profiler"]
+    if prof is not None:
+        _stop_profiler(prof, out_dir); _state["profiler"] = None
+    return fp
+
+def _start_profiler(mode: str):
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument non installé: profil cProfile utilisé à la place.", file=sys.stderr)
+        else:
+            p = Profiler(); p.start(); return ("pyinstrument", p)
+    import cProfile
+    p = cProfile.Profile(); p.enable(); return ("cprofile", p)
+
+def _stop_profiler(prof, out_dir: Path):
+    kind, p = prof
+    if kind == "pyinstrument":
+        p.stop(); (out_dir / "perplexity_profile.html").write_text(p.output_html(), encoding="utf-8")
+        return
+    import io, pstats
+    p.disable(); p.dump_stats(str(out_dir / "perplexity_profile.prof"))
+    buf = io.StringIO(); pstats.Stats(p, stream=buf).sort_stats("cumulative").print_stats(40)
+    (out_dir / "perplexity_profile.txt").write_text(buf.getvalue(), encoding="utf-8")
+
+def _write_at_exit():
+    if _state["mode"] is None: return
+    try:
+        fp = write_report()
+        print(summary_table(), file=sys.stderr); print(f"Rapport de temps: {fp}", file=sys.stderr)
+    except Exception as e:
+        print(f"Rapport de temps non écrit: {e}", file=sys.stderr)
+
+if os.environ.get(ENV_MODE):
+    configure()
@@ -0,0 +1,173 @@
+from pathlib import Path
+from functools import lru_cache
+import os
+import time
+from src import instrument
+
+SKIP_APTS = ("PAC","COMMUNS","TOTAL","")
+NO_APT_MSG = "Aucun appartement à facturer : vérifiez le fichier Locataires ou les colonnes d'appartements (EF/EC/Chauffage/Refroidissement)."
+DEFAULT_TITLE = "Facture d'électricité - Décompte groupé"
+DETAIL_LINES = [
+    "1) Prix kWh (global simple) = (Prix_HP + Prix_HC) / 2 (CHF/kWh).",
+    "2) Prix kWh (global réel) = pondération HP/HC/Solaire sur PAC + Communs.",
+    "3) Prix kWh Chauffage/Refroidissement = pondération PAC (HP/HC/Solaire).",
+    "4) EF : Prix_EF (CHF/m³) — 'Frais Eau'.",
+    "5) EC : Prix_EC = Prix_EF + ((kWh_PAC_HP+HC+Sol − kWh_Chauffage − kWh_Refroid.) × Prix_KWh(global réel)) / m³_EC.",
+    "6) EU : Prix_EU (CHF/m³) appliqué sur EC.",
+    "7) Montant_énergie(app) = kWh_Chauffage × Prix_KWh_PAC + kWh_Refroid. × Prix_KWh_PAC.",
+    "8) Montant_eau(app) = m³_EF × Prix_EF + m³_EC × Prix_EC + m³_EC × Prix_EU.",
+    "9) Total(app) = Montant_énergie + Montant_eau."
+]
+AUTO_POOL_MIN = 8  # en dessous, le coût de démarrage des processus dépasse le gain
+
+def safe_filename(name: str) -> str:
+    return "".join(c for c in str(name) if c.isalnum() or c in (" ","-","_",".")).strip().replace(" ","_")
+
+def _fmt_chf(v: float) -> str:
+    return f"{v:,.2f}".replace(",", " ").replace(".", ",")
+
+def invoice_jobs(rep_df) -> list:
+    """Une entrée {apt, me, ma} par appartement facturable de rep_df (PAC/COMMUNS/TOTAL exclus)."""
+    if rep_df is None or rep_df.empty or not any(a not in ("PAC","COMMUNS","",None) for a in rep_df.get("Appartement", [])):
+        raise RuntimeError(NO_APT_MSG)
+    jobs = []
+    for rec in rep_df.to_dict("records"):
+        apt = rec.get("Appartement","")
+        if apt in SKIP_APTS: continue
+        jobs.append({"apt": apt, "me": float(rec.get("Montant_energie",0) or 0), "ma": float(rec.get("Montant_eau",0) or 0)})
+    return jobs
+
+def require_reportlab():
+    try:
+        from reportlab.pdfgen import canvas
+    except Exception as e:
+        raise ImportError("ReportLab n'est pas installé. Installez-le avec: pip install reportlab") from e
+    return canvas
+
+@lru_cache(maxsize=1)
+def _pdf_static():
+    """Parties invariantes construites une fois par processus (format, marges, style de tableau)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    style = TableStyle([("GRID",(0,0),(-1,-1),0.5,colors.black),("BACKGROUND",(0,0),(-1,0),colors.lightgrey),("FONTNAME",(0,0),(-1,0),"Helvetica-Bold"),("ALIGN",(1,1),(1,-1),"RIGHT"),("FONTNAME",(0,-1),(-1,-1),"Helvetica-Bold")])
+    return {"page": A4, "margin": 18*mm, "mm": mm, "table_style": style, "col_widths": [100*mm, 50*mm]}
+
+def _define_forms(c, header_title: str):
+    """Enregistre l'en-tête et la page 'Détails des calculs' comme XObjects réutilisables du canevas."""
+    st = _pdf_static(); W,H = st["page"]; margin = st["margin"]
+    c.beginForm("entete")
+    y = H - margin
+    c.setFont("Helvetica-Bold", 12); c.drawString(margin, y, "Edi et Alain Thiébaud"); y -= 14
+    c.setFont("Helvetica", 10); c.drawString(margin, y, "Rue d'Orbe 68, 1400 Yverdon-les-Bains"); y -= 24
+    c.setFont("Helvetica-Bold", 14); c.drawString(margin, y, header_title); y -= 10
+    c.line(margin, y, W-margin, y)
+    c.setFont("Helvetica-Oblique", 8); c.drawString(margin, margin, "Facture générée automatiquement (Chat149).")
+    c.endForm()
+    c.beginForm("details")
+    y = H - margin; c.setFont("Helvetica-Bold", 12); c.drawString(margin, y, "Détails des calculs"); y -= 12
+    c.setFont("Helvetica", 9)
+    for ln in DETAIL_LINES:
+        c.drawString(margin, y, ln); y -= 12
+    y_qr = margin + 80; c.setFont("Helvetica-Oblique", 9); c.drawString(margin, y_qr + 50, "Zone QR (placeholder)")
+    c.rect(margin, y_qr, 50*st["mm"], 50*st["mm"], stroke=1, fill=0)
+    c.setFont("Helvetica-Oblique", 8); c.drawString(margin, margin, "Placez ici le QR-bill si nécessaire.")
+    c.endForm()
+
+def _draw_invoice(c, job: dict, period_label: str):
+    from reportlab.platypus import Table
+    st = _pdf_static(); W,H = st["page"]; margin = st["margin"]
+    apt, me, ma = job["apt"], job["me"], job["ma"]; tt = me+ma
+    c.doForm("entete")
+    y = H - margin - 14 - 24 - 10 - 16
+    c.setFont("Helvetica", 11); c.drawString(margin, y, f"Appartement : {apt}"); y -= 14
+    c.drawString(margin, y, f"Période : {period_label}"); y -= 24
+    data = [["Élément","Montant (CHF)"], ["TOTAL ÉNERGIE", _fmt_chf(me)], ["TOTAL EAU", _fmt_chf(ma)], ["TOTAL À PAYER", _fmt_chf(tt)]]
+    tbl = Table(data, colWidths=st["col_widths"]); tbl.setStyle(st["table_style"])
+    _, th = tbl.wrapOn(c, W-2*margin, y-margin); tbl.drawOn(c, margin, y-th)
+    c.showPage()
+    c.doForm("details")
+    c.showPage()
+
+def render_pdf(fp: str, job: dict, period_label: str, header_title: str = DEFAULT_TITLE) -> str:
+    canvas = require_reportlab()
+    c = canvas.Canvas(str(fp), pagesize=_pdf_static()["page"])
+    _define_forms(c, header_title); _draw_invoice(c, job, period_label); c.save()
+    return str(fp)
+
+def render_pdf_merged(fp: str, jobs: list, period_label: str, header_title: str = DEFAULT_TITLE, cancel=None) -> str:
+    """
+    Toutes les factures dans un seul PDF, en une passe (en-tête et détails partagés).
+    cancel: threading.Event optionnel; si levé, rien n'est écrit et None est retourné.
+    """
+    canvas = require_reportlab()
+    c = canvas.Canvas(str(fp), pagesize=_pdf_static()["page"])
+    _define_forms(c, header_title)
+    for job in jobs:
+        if cancel is not None and cancel.is_set(): return None
+        _draw_invoice(c, job, period_label)
+    c.save()
+    return str(fp)
+
+def render_xlsx(fp: str, job: dict, period_label: str, header_title: str = DEFAULT_TITLE) -> str:
+    try:
+        from openpyxl import Workbook
+        from openpyxl.styles import Font
+    except Exception as e:
+        raise ImportError("openpyxl manquant. Installez-le avec: pip install openpyxl") from e
+    apt, me, ma = job["apt"], job["me"], job["ma"]; tt = me+ma
+    wb = Workbook(); ws = wb.active; ws.title = "Facture"
+    bold = Font(bold=True)
+    ws["A1"]="Edi et Alain Thiébaud"; ws["A1"].font=bold
+    ws["A2"]="Rue d'Orbe 68, 1400 Yverdon-les-Bains"
+    ws["A4"]=header_title; ws["A4"].font=bold
+    ws["A6"]="Appartement:"; ws["B6"]=apt
+    ws["A7"]="Période:"; ws["B7"]=period_label
+    ws.append([]); ws.append(["Élément","Montant (CHF)"]); ws["A9"].font=bold; ws["B9"].font=bold
+    ws.append(["TOTAL ÉNERGIE", me])
+    ws.append(["TOTAL EAU", ma])
+    ws.append(["TOTAL À PAYER", tt]); ws["A12"].font=bold; ws["B12"].font=bold
+    ws2 = wb.create_sheet("Détails"); ws2["A1"]="Détail explicatif (voir application)."
+    wb.save(fp)
+    return str(fp)
+
+RENDERERS = {"pdf": render_pdf, "xlsx": render_xlsx}
+
+def _render_timed(kind: str, fp: str, job: dict, period_label: str, header_title: str):
+    t0 = time.perf_counter()
+    path = RENDERERS[kind](fp, job, period_label, header_title)
+    return path, time.perf_counter() - t0
+
+def invoice_path(out_base: Path, kind: str, apt, period_label: str) -> Path:
+    name = f"Facture_{apt}_{period_label}.{kind}"
+    return Path(out_base) / (safe_filename(name) if kind == "pdf" else name)
+
+def iter_render(kind: str, out_base: Path, jobs: list, period_label: str, header_title: str = DEFAULT_TITLE, workers: int = None, cancel=None):
+    """
+    Génère les factures une à une et produit (fait, total, chemin) dès qu'un fichier est écrit.
+    workers=None: pool de processus à partir de AUTO_POOL_MIN factures; workers=1: séquentiel.
+    Fermer le générateur avant la fin annule les factures encore en attente.
+    cancel: threading.Event optionnel, vérifié entre deux factures (les factures déjà écrites sont conservées).
+    """
+    total = len(jobs)
+    paths = [str(invoice_path(out_base, kind, j["apt"], period_label)) for j in jobs]
+    if workers is None: workers = min(os.cpu_count() or 1, 8) if total >= AUTO_POOL_MIN else 1
+    if workers <= 1:
+        for i, (fp, job) in enumerate(zip(paths, jobs), 1):
+            if cancel is not None and cancel.is_set(): return
+            path, dt = _render_timed(kind, fp, job, period_label, header_title)
+            instrument.record("invoice.render", dt, kind=kind, apt=str(job["apt"]))
+            yield i, total, path
+        return
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futs = {ex.submit(_render_timed, kind, fp, job, period_label, header_title): job for fp, job in zip(paths, jobs)}
+        try:
+            for i, fut in enumerate(as_completed(futs), 1):
+                path, dt = fut.result()
+                instrument.record("invoice.render", dt, kind=kind, apt=str(futs[fut]["apt"]), worker=True)
+                yield i, total, path
+                if cancel is not None and cancel.is_set(): return
+        finally:
+            for f in futs: f.cancel()
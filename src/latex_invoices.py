@@ -0,0 +1,191 @@
+from pathlib import Path
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from src import instrument
+from src.invoice_render import DEFAULT_TITLE, DETAIL_LINES, _fmt_chf, invoice_path
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+TEMPLATE = ROOT / "assets" / "facture_template.tex"
+DUMP_MARKER = r"\csname endofdump\endcsname"
+BACKENDS = ("reportlab", "latex", "auto")
+
+_TEX_ESCAPES = {"\\": r"\textbackslash{}", "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#", "_": r"\_", "{": r"\{", "}": r"\}",
+                "~": r"\textasciitilde{}", "^": r"\textasciicircum{}", "−": "-", "×": r"$\times$", "³": r"\textsuperscript{3}",
+                "→": r"$\rightarrow$", "•": r"\textbullet{}"}
+
+class LatexError(RuntimeError):
+    pass
+
+def find_pdflatex():
+    """Chemin de pdflatex, ou None si aucune installation TeX n'est trouvée."""
+    return shutil.which("pdflatex")
+
+def tex_escape(s) -> str:
+    return "".join(_TEX_ESCAPES.get(c, c) for c in str(s))
+
+def _detail_items(details_df=None) -> list:
+    if details_df is None or getattr(details_df, "empty", True):
+        return [tex_escape(ln) for ln in DETAIL_LINES]
+    items = []
+    for rec in details_df.to_dict("records"):
+        val = rec.get("Valeur", ""); desc = rec.get("Description", "")
+        items.append(rf"\textbf{{{tex_escape(rec.get('Clé', ''))}}} : {tex_escape(val)}" + (f" --- {tex_escape(desc)}" if desc else ""))
+    return items
+
+def issue_date(period_label: str):
+    """Date de facture déduite de la période: dernier jour du mois ('2025-12') ou de l'année ('2025'); None sinon."""
+    parts = str(period_label).strip().split("-")
+    try:
+        year = int(parts[0]); month = int(parts[1]) if len(parts) > 1 else 12
+        return (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)) if 1 <= month <= 12 else None
+    except (ValueError, IndexError):
+        return None
+
+def fill_template(template: str, job: dict, period_label: str, header_title: str = DEFAULT_TITLE, details_df=None, issued: date = None) -> str:
+    """
+    Source LaTeX d'une facture: les macros \\Facture* sont définies juste après le marqueur de fin de format,
+    avant les \\providecommand d'exemple du modèle (qui ne les écrasent pas).
+    issued: date imprimée, défaut issue_date(période) (à défaut, la période elle-même). Elle fait partie du source,
+    donc de la clé de cache: elle ne dépend pas du jour de compilation, pour qu'une facture inchangée reste en cache.
+    """
+    if DUMP_MARKER not in template: raise LatexError(f"Marqueur {DUMP_MARKER} absent du modèle.")
+    me, ma = job["me"], job["ma"]; tt = me + ma
+    qr = "".join(c for c in f"Facture {job['apt']} {period_label} CHF {tt:.2f}" if c.isalnum() or c in " -.:/")
+    issued = issued or issue_date(period_label)
+    fields = {"FactureTitre": tex_escape(header_title), "FactureAppartement": tex_escape(job["apt"]), "FacturePeriode": tex_escape(period_label),
+              "FactureDate": issued.strftime("%d.%m.%Y") if issued else tex_escape(period_label),
+              "FactureEnergie": _fmt_chf(me), "FactureEau": _fmt_chf(ma), "FactureTotal": _fmt_chf(tt), "FactureQR": qr,
+              "FactureDetails": "\n".join(r"\item " + it for it in _detail_items(details_df))}
+    defs = "\n".join(rf"\newcommand{{\{k}}}{{{v}}}" for k, v in fields.items())
+    return template.replace(DUMP_MARKER, DUMP_MARKER + "\n" + defs, 1)
+
+class LatexRenderer:
+    """
+    Factures PDF compilées par pdflatex depuis assets/facture_template.tex.
+    - Pool borné de processus pdflatex (workers, défaut: min(CPU, 4)).
+    - Cache par empreinte du source (et du logo) dans cache_dir: une facture inchangée n'est pas recompilée
+      (au-delà de max_entries PDF, les plus anciens sont supprimés).
+    - Préambule précompilé une fois (format mylatexformat); si sa construction échoue, compilation complète.
+    """
+    def __init__(self, template: Path = TEMPLATE, cache_dir: Path = None, workers: int = None, pdflatex: str = None, use_format: bool = True, timeout: float = 120.0, max_entries: int = 5000):
+        self.pdflatex = pdflatex or find_pdflatex()
+        if not self.pdflatex: raise LatexError("pdflatex introuvable: installez une distribution TeX (TeX Live, MiKTeX).")
+        self.template = Path(template)
+        self.cache_dir = Path(cache_dir or (ROOT / ".cache" / "latex")); self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers or min(os.cpu_count() or 1, 4)
+        self.use_format = use_format
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._text = self.template.read_text(encoding="utf-8")
+        self._fmt = None            # None: pas encore tenté; False: indisponible; sinon nom du format
+        self._fmt_lock = threading.Lock()
+        self.hits = 0; self.compiled = 0
+
+    def _env(self) -> dict:
+        env = dict(os.environ)
+        # '' final: chemins par défaut de kpathsea; la racine du projet pour \includegraphics{assets/logo.png}
+        env["TEXINPUTS"] = os.pathsep.join([str(ROOT), str(self.template.parent), ""])
+        env["TEXFORMATS"] = os.pathsep.join([str(self.cache_dir), ""])
+        return env
+
+    def _run(self, args: list, cwd: Path):
+        try:
+            res = subprocess.run([self.pdflatex, "-interaction=nonstopmode", "-halt-on-error", *args], cwd=str(cwd), env=self._env(),
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise LatexError(f"pdflatex: {e}") from e
+        if res.returncode != 0:
+            tail = res.stdout.decode("utf-8", "replace").strip().splitlines()[-15:]
+            raise LatexError("pdflatex a échoué:\n" + "\n".join(tail))
+
+    def format_name(self):
+        """Construit (une fois) le format du préambule; None si mylatexformat est indisponible ou si la construction échoue."""
+        if not self.use_format: return None
+        with self._fmt_lock:
+            if self._fmt is None:
+                preamble = self._text.split(DUMP_MARKER, 1)[0]
+                name = "facture_" + hashlib.sha1(preamble.encode("utf-8")).hexdigest()[:12]
+                if (self.cache_dir / f"{name}.fmt").exists():
+                    self._fmt = name
+                else:
+                    try:
+                        with instrument.span("latex.format"), tempfile.TemporaryDirectory(prefix="facture_fmt_") as tmp:
+                            (Path(tmp) / "preambule.tex").write_text(self._text, encoding="utf-8")
+                            self._run(["-ini", f"-jobname={name}", "&pdflatex", "mylatexformat.ltx", "preambule.tex"], Path(tmp))
+                            os.replace(Path(tmp) / f"{name}.fmt", self.cache_dir / f"{name}.fmt")
+                        self._fmt = name
+                    except (LatexError, OSError) as e:
+                        logger.info("Format LaTeX précompilé indisponible, compilation complète: %s", e)
+                        self._fmt = False
+            return self._fmt or None
+
+    def _key(self, tex: str) -> str:
+        h = hashlib.sha1(tex.encode("utf-8"))
+        logo = ROOT / "assets" / "logo.png"
+        if logo.exists(): st = logo.stat(); h.update(f"{st.st_mtime_ns}:{st.st_size}".encode())
+        return h.hexdigest()
+
+    def compile(self, tex: str, fp) -> str:
+        """Compile tex vers fp (copie depuis le cache si ce source a déjà été compilé)."""
+        cached = self.cache_dir / f"{self._key(tex)}.pdf"
+        if cached.exists():
+            self.hits += 1; shutil.copyfile(cached, fp); os.utime(cached)
+            return str(fp)
+        fmt = self.format_name()
+        with tempfile.TemporaryDirectory(prefix="facture_") as tmp:
+            tmp = Path(tmp); (tmp / "facture.tex").write_text(tex, encoding="utf-8")
+            try:
+                self._run(([f"-fmt={fmt}"] if fmt else []) + ["facture.tex"], tmp)
+            except LatexError:
+                if not fmt: raise
+                self._run(["facture.tex"], tmp)
+            part = self.cache_dir / f"{cached.stem}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(tmp / "facture.pdf", part); os.replace(part, cached)
+        self.compiled += 1; shutil.copyfile(cached, fp)
+        self._evict()
+        return str(fp)
+
+    def _evict(self):
+        entries = []
+        for e in os.scandir(self.cache_dir):
+            if e.name.endswith(".pdf"):
+                try: entries.append((e.stat().st_mtime, e.path))
+                except OSError: pass
+        if len(entries) <= self.max_entries: return
+        for _, path in sorted(entries)[:len(entries) - self.max_entries]:
+            try: os.remove(path)
+            except OSError: pass
+
+    def _render_timed(self, fp: str, job: dict, period_label: str, header_title: str, details_df, issued: date = None):
+        t0 = time.perf_counter()
+        path = self.compile(fill_template(self._text, job, period_label, header_title, details_df, issued), fp)
+        return path, time.perf_counter() - t0
+
+    def iter_render(self, out_base: Path, jobs: list, period_label: str, header_title: str = DEFAULT_TITLE, details_df=None, workers: int = None, cancel=None, issued: date = None):
+        """
+        Comme invoice_render.iter_render('pdf', ...): produit (fait, total, chemin) dès qu'une facture est écrite.
+        workers: processus pdflatex simultanés (défaut: self.workers). issued: date imprimée (voir fill_template).
+        """
+        total = len(jobs)
+        paths = [str(invoice_path(out_base, "pdf", j["apt"], period_label)) for j in jobs]
+        self.format_name()  # une seule construction, avant de lancer le pool
+        with ThreadPoolExecutor(max_workers=workers or self.workers, thread_name_prefix="pdflatex") as ex:
+            futs = {ex.submit(self._render_timed, fp, job, period_label, header_title, details_df, issued): job for fp, job in zip(paths, jobs)}
+            try:
+                for i, fut in enumerate(as_completed(futs), 1):
+                    path, dt = fut.result()
+                    instrument.record("invoice.render", dt, kind="pdf", apt=str(futs[fut]["apt"]), backend="latex")
+                    yield i, total, path
+                    if cancel is not None and cancel.is_set(): return
+            finally:
+                for f in futs: f.cancel()
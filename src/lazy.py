@@ -0,0 +1,48 @@
+import importlib
+import threading
+import time
+
+class LazyModule:
+    """
+    Module importé au premier accès à un attribut (ex. pd = LazyModule("pandas")).
+    Les modules qui l'utilisent doivent avoir `from __future__ import annotations`
+    pour que les annotations (pd.DataFrame) ne déclenchent pas l'import.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name} ({'chargé' if self._module is not None else 'non chargé'})>"
+
+HEAVY_MODULES = ("pandas", "openpyxl", "pandas.io.excel._openpyxl", "reportlab.pdfgen.canvas", "reportlab.platypus")
+
+def preload(modules=HEAVY_MODULES, on_done=None) -> threading.Thread:
+    """
+    Importe et réchauffe les modules lourds dans un thread d'arrière-plan pendant que l'interface s'affiche.
+    Les modules absents (ex. ReportLab non installé) sont ignorés. on_done(secondes, manquants) en fin de chargement.
+    """
+    def _run():
+        t0 = time.perf_counter(); missing = []
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                missing.append(name)
+        try:
+            import pandas as pd
+            pd.DataFrame({"a": [1.0, 2.0]}).sum()
+        except ImportError:
+            pass
+        if on_done: on_done(time.perf_counter() - t0, missing)
+    t = threading.Thread(target=_run, name="preload", daemon=True)
+    t.start()
+    return t
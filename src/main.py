@@ -1,8 +1,35 @@
-
+import time
+_T0 = time.perf_counter()
+import logging
 import tkinter as tk
-from src.app_ui import AppGUI
+from src import instrument
+from src.lazy import preload
+from src.tasks import TaskRunner
+
+logger = logging.getLogger(__name__)
+
+def _on_first_paint(root, event=None):
+    if event is not None and event.widget is not root: return
+    root.unbind("<Map>")
+    dt = time.perf_counter() - _T0
+    root.startup_seconds = dt
+    instrument.record("startup.first_paint", dt)
+    logger.info("Premier affichage après %.3f s", dt)
+
+def _on_preloaded(dt, missing):
+    instrument.record("startup.preload", dt, missing=missing)
+    logger.info("Modules lourds chargés en arrière-plan en %.3f s%s", dt, f" (absents: {', '.join(missing)})" if missing else "")
 
 def main():
+    # Console des lanceurs (RUN.bat): temps du premier affichage et du préchargement visibles sans PERPLEXITY_PROFILE.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     root = tk.Tk()
+    root.bind("<Map>", lambda e: _on_first_paint(root, e))
+    preload(on_done=_on_preloaded)
+    root.task_runner = TaskRunner(root)  # calculs/exports hors du thread Tk
+    from src.app_ui import AppGUI
     AppGUI(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        root.task_runner.shutdown()
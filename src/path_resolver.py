@@ -0,0 +1,88 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+DEFAULT_REWRITES = [("C:/Users/a.thiebaud.IS", "C:/Users/a.thiebaud")]
+
+class PathResolver:
+    """
+    Résolution de chemins avec mémo à durée de vie limitée (ttl, en secondes; miss_ttl pour un chemin introuvable,
+    court pour qu'un fichier créé entre-temps soit vu rapidement). Les entrées expirées sont purgées au fil des résolutions.
+    - rewrites: paires (préfixe, remplacement) essayées après le chemin d'origine (ex. profil Windows renommé).
+    - Le premier candidat est testé seul; s'il n'existe pas, les autres sont testés en parallèle
+      et le premier existant dans l'ordre de priorité est retenu.
+    - stats(): hits/misses du mémo, nombre et durée cumulée des accès disque.
+    """
+    def __init__(self, rewrites=None, ttl: float = 60.0, max_workers: int = 4, miss_ttl: float = 2.0):
+        self.rewrites = [tuple(r) for r in (DEFAULT_REWRITES if rewrites is None else rewrites)]
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._next_prune = 0.0
+        self.max_workers = max_workers
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stats = {"hits": 0, "misses": 0, "probes": 0, "probe_seconds": 0.0}
+
+    def candidates(self, p: str) -> list:
+        s_norm = str(p).replace("\\", "/")
+        base = [s_norm]
+        for src, dst in self.rewrites:
+            src_n = src.replace("\\", "/")
+            if src_n in s_norm:
+                base.append(s_norm.replace(src_n, dst.replace("\\", "/")))
+        out = []
+        for c in base + [c.replace("/", "\\") for c in base]:
+            if c not in out: out.append(c)
+        return out
+
+    def _exists(self, c: str) -> bool:
+        t = time.perf_counter()
+        try:
+            return Path(c).exists()
+        except Exception:
+            return False
+        finally:
+            with self._lock:
+                self._stats["probes"] += 1; self._stats["probe_seconds"] += time.perf_counter() - t
+
+    def _probe(self, cands: list):
+        if self._exists(cands[0]): return cands[0]
+        rest = cands[1:]
+        if not rest: return None
+        if len(rest) == 1 or self.max_workers <= 1:
+            return next((c for c in rest if self._exists(c)), None)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="path-probe")
+        found = list(self._pool.map(self._exists, rest))
+        return next((c for c, ok in zip(rest, found) if ok), None)
+
+    def resolve(self, p: str) -> str:
+        """Premier candidat existant, sinon la version backslash du chemin normalisé."""
+        if not p:
+            return ""
+        key = str(p); now = time.monotonic()
+        with self._lock:
+            hit = self._memo.get(key)
+            if hit and hit[1] > now:
+                self._stats["hits"] += 1
+                return hit[0]
+            self._stats["misses"] += 1
+        found = self._probe(self.candidates(key))
+        res = found or key.replace("\\", "/").replace("/", "\\")
+        with self._lock:
+            if now >= self._next_prune:
+                for k in [k for k, (_, exp) in self._memo.items() if exp <= now]: del self._memo[k]
+                self._next_prune = now + self.ttl
+            self._memo[key] = (res, now + (self.ttl if found else self.miss_ttl))
+        return res
+
+    def invalidate(self, p: str = None):
+        with self._lock:
+            if p is None: self._memo.clear()
+            else: self._memo.pop(str(p), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._memo)}
@@ -0,0 +1,101 @@
+from pathlib import Path
+import hashlib
+import os
+import pickle
+import threading
+
+STORE_VERSION = 2  # à incrémenter quand la forme des objets mis en cache change (parsing, _prune_frame, entrées '#last'...)
+
+class SheetCache:
+    """
+    Cache disque des feuilles parsées, clé = STORE_VERSION + chemin résolu + mtime + taille
+    (ou empreinte SHA-1 du contenu si use_hash=True).
+    - Un fichier modifié change de clé: l'ancienne entrée n'est plus jamais lue et finit évincée.
+    - Éviction LRU (date d'accès = mtime de l'entrée) dès que max_bytes est dépassé, jusqu'à LOW_WATER * max_bytes.
+      La taille totale est suivie en mémoire: le dossier n'est parcouru qu'au premier put et lors des évictions.
+    """
+    SUFFIX = ".pkl"
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 256*1024*1024, use_hash: bool = False):
+        self.cache_dir = Path(cache_dir); self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.use_hash = use_hash
+        self.hits = 0; self.misses = 0
+        self._total = None  # octets en cache, connus après le premier parcours du dossier
+        self._lock = threading.Lock()
+
+    def key(self, path: Path):
+        try:
+            p = Path(path).resolve(); st = p.stat()
+        except OSError:
+            return None
+        if self.use_hash:
+            h = hashlib.sha1(f"v{STORE_VERSION}|".encode("utf-8"))
+            with open(p, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            return h.hexdigest()
+        return hashlib.sha1(f"v{STORE_VERSION}|{p}|{st.st_mtime_ns}|{st.st_size}".encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str, name: str) -> Path:
+        tag = hashlib.sha1(str(name).encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"{key}_{tag}{self.SUFFIX}"
+
+    def get(self, key: str, name: str):
+        if not key: return None
+        fp = self._entry(key, name)
+        try:
+            with open(fp, "rb") as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1; return None
+        except Exception:
+            fp.unlink(missing_ok=True); self.misses += 1; return None
+        try: os.utime(fp)
+        except OSError: pass
+        self.hits += 1
+        return obj
+
+    def put(self, key: str, name: str, obj):
+        if not key: return
+        fp = self._entry(key, name); tmp = fp.with_name(f"{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = tmp.stat().st_size
+            try: old = fp.stat().st_size
+            except OSError: old = 0
+            os.replace(tmp, fp)
+        except OSError:
+            tmp.unlink(missing_ok=True); return
+        with self._lock:
+            if self._total is None: self._total = self._scan()[1]
+            else: self._total += size - old
+            over = self._total > self.max_bytes
+        if over: self.evict()
+
+    def _scan(self):
+        entries = []
+        for fp in self.cache_dir.glob(f"*{self.SUFFIX}"):
+            try: st = fp.stat()
+            except OSError: continue
+            entries.append((st.st_mtime, st.st_size, fp))
+        return entries, sum(e[1] for e in entries)
+
+    def evict(self):
+        entries, total = self._scan()
+        if total <= self.max_bytes:
+            with self._lock: self._total = total
+            return
+        for _, size, fp in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes * self.LOW_WATER: break
+            fp.unlink(missing_ok=True); total -= size
+        with self._lock:
+            self._total = total
+
+    def clear(self):
+        for fp in self.cache_dir.glob(f"*{self.SUFFIX}"):
+            fp.unlink(missing_ok=True)
+        with self._lock:
+            self._total = 0
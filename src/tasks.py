@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    """Poignée d'une tâche soumise à TaskRunner: annulation coopérative et progression."""
+    def __init__(self, runner, on_progress=None, on_cancel=None):
+        self._runner = runner
+        self._on_progress = on_progress
+        self._on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """
+        Demande l'arrêt: la tâche s'interrompt au prochain point de contrôle (ex. entre deux factures).
+        Une tâche encore en file ne démarre pas; on_cancel est alors posté ici.
+        """
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            if self._on_cancel: self._runner._post(self._on_cancel)
+            self._runner._post(self._runner._tasks.discard, self)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancel_event.is_set(): raise TaskCancelled()
+
+    def progress(self, *values):
+        """Appelable depuis le thread de travail; le rappel on_progress s'exécute dans le thread Tk."""
+        if self._on_progress: self._runner._post(self._on_progress, *values)
+
+class TaskRunner:
+    """
+    Exécute calculs et exports hors du thread Tk.
+    Les résultats, erreurs et progressions transitent par une file relue toutes les poll_ms
+    millisecondes via root.after(): les rappels s'exécutent donc toujours dans le thread Tk.
+
+        runner = TaskRunner(root)
+        task = runner.submit(engine.export_invoices_pdf, out_dir, period, rep_df, None,
+                             with_task=True, on_done=..., on_error=..., on_progress=...)
+        task.cancel()
+
+    with_task=True passe progress=task.progress et cancel=task.cancel_event à la fonction
+    (signature des exports de CalculationEngine).
+    """
+    MAX_CALLBACKS_PER_TICK = 50
+
+    def __init__(self, root, max_workers: int = 2, poll_ms: int = 16):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tache")
+        self._queue = queue.Queue()
+        self._tasks = set()
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    def _post(self, fn, *args):
+        self._queue.put((fn, args))
+
+    def submit(self, fn, *args, with_task: bool = False, on_done=None, on_error=None, on_cancel=None, on_progress=None, **kwargs) -> Task:
+        task = Task(self, on_progress, on_cancel)
+        if with_task:
+            kwargs.setdefault("progress", task.progress); kwargs.setdefault("cancel", task.cancel_event)
+        def _run():
+            try:
+                result = fn(*args, **kwargs)
+            except TaskCancelled:
+                if on_cancel: self._post(on_cancel)
+            except BaseException as e:
+                if on_error: self._post(on_error, e)
+                else: self._post(self._report_error, e)
+            else:
+                if task.cancelled:
+                    if on_cancel: self._post(on_cancel)
+                elif on_done:
+                    self._post(on_done, result)
+            finally:
+                self._post(self._tasks.discard, task)
+        self._tasks.add(task)
+        task.future = self._executor.submit(_run)
+        return task
+
+    def _report_error(self, e):
+        self.root.report_callback_exception(type(e), e, e.__traceback__)
+
+    def _poll(self):
+        for _ in range(self.MAX_CALLBACKS_PER_TICK):
+            try:
+                fn, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                self._report_error(e)
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._tasks)
+
+    def shutdown(self):
+        """Annule les tâches en cours et arrête la relève de la file (à appeler à la fermeture de la fenêtre)."""
+        for task in list(self._tasks): task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id); self._after_id = None
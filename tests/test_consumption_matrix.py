@@ -0,0 +1,75 @@
+"""Équivalence du calcul vectorisé des montants (_consumption_matrix + _apartment_amounts) avec l'ancienne boucle iterrows()."""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.app_logic import _apartment_amounts, _consumption_matrix
+from src.file_io import WorkbookSnapshot
+
+WATER = {"price_ef": 2.15, "price_ec": 7.4321, "price_eu": 1.35}
+ENERGY = {"price_pac": 0.24317}
+
+def old_loop(path, tenants_df, water, energy) -> pd.DataFrame:
+    """Copie de la boucle de build_repartitions avant le passage aux opérations par colonne."""
+    xl = pd.ExcelFile(path); rows = []
+    df_ef = xl.parse("Eau Froide") if "Eau Froide" in xl.sheet_names else pd.DataFrame()
+    df_ec = xl.parse("Eau Chaude") if "Eau Chaude" in xl.sheet_names else pd.DataFrame()
+    df_ch = xl.parse("Chauffage") if "Chauffage" in xl.sheet_names else pd.DataFrame()
+    df_rf = xl.parse("Refroidissement") if "Refroidissement" in xl.sheet_names else pd.DataFrame()
+    last_ef = df_ef.iloc[-1] if not df_ef.empty else pd.Series(dtype=float)
+    last_ec = df_ec.iloc[-1] if not df_ec.empty else pd.Series(dtype=float)
+    last_ch = df_ch.iloc[-1] if not df_ch.empty else pd.Series(dtype=float)
+    last_rf = df_rf.iloc[-1] if not df_rf.empty else pd.Series(dtype=float)
+    for _, t in tenants_df.iterrows():
+        apt = t.get("Appartement","")
+        ef = float(pd.to_numeric(last_ef.get(apt,0), errors="coerce") or 0.0)
+        ec = float(pd.to_numeric(last_ec.get(apt,0), errors="coerce") or 0.0)
+        ch = float(pd.to_numeric(last_ch.get(apt,0), errors="coerce") or 0.0)
+        rf = float(pd.to_numeric(last_rf.get(apt,0), errors="coerce") or 0.0)
+        montant_eau = ef*water["price_ef"] + ec*water["price_ec"] + ec*water["price_eu"]
+        montant_energie = ch*energy["price_pac"] + rf*energy["price_pac"]
+        rows.append({"Appartement":apt,"Chauffage_kWh":ch,"Refroid_kWh":rf,"Eau_froide_m3":ef,"Eau_chaude_m3":ec,"Montant_eau":round(montant_eau,2),"Montant_energie":round(montant_energie,2)})
+    return pd.DataFrame(rows)
+
+def new_amounts(path, tenants_df, water, energy) -> pd.DataFrame:
+    return _apartment_amounts(_consumption_matrix(WorkbookSnapshot(path), tenants_df["Appartement"]), water, energy)
+
+def make_workbook(path: Path, n_apartments: int = 40, seed: int = 0, with_cooling: bool = True) -> Path:
+    """Relevés aléatoires; la dernière ligne contient un blanc (NaN) et une valeur non numérique."""
+    rng = np.random.default_rng(seed); apts = [f"A{i}" for i in range(1, n_apartments + 1)]
+    sheets = ["Eau Froide", "Eau Chaude", "Chauffage"] + (["Refroidissement"] if with_cooling else [])
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        for k, sh in enumerate(sheets):
+            d = {"Période": ["2025-10", "2025-11", "2025-12"]}
+            for a in apts: d[a] = list(rng.uniform(0, 150, 3).round(3))
+            d[apts[k]][-1] = None          # relevé manquant
+            d[apts[k + 5]][-1] = "n/a"     # relevé non numérique
+            d["5"] = list(rng.uniform(0, 10, 3).round(3))
+            d["Communs"] = list(rng.uniform(0, 20, 3).round(3))
+            pd.DataFrame(d).to_excel(w, sheet_name=sh, index=False)
+    return Path(path)
+
+TENANT_CASES = {
+    "toutes": [f"A{i}" for i in range(1, 41)],
+    "doublons": ["A1", "A1", "A2", "A3", "A3", "A3"],
+    "absents": ["A1", "A999", "X", "A40"],
+    "nan_et_non_textuels": ["A1", np.nan, None, 5, "5", 3.5, "A6"],
+    "mixte": ["A1", "A1", np.nan, "A300", 5, "A2", "A7", "Communs"],
+}
+
+@pytest.mark.parametrize("with_cooling", [True, False], ids=["refroidissement", "sans_refroidissement"])
+@pytest.mark.parametrize("case", list(TENANT_CASES))
+def test_amounts_match_iterrows_loop(tmp_path, case, with_cooling):
+    path = make_workbook(tmp_path / "charges.xlsx", with_cooling=with_cooling)
+    tenants_df = pd.DataFrame({"Appartement": TENANT_CASES[case]})
+    pd.testing.assert_frame_equal(new_amounts(path, tenants_df, WATER, ENERGY), old_loop(path, tenants_df, WATER, ENERGY))
+
+def test_amounts_match_with_zero_prices(tmp_path):
+    path = make_workbook(tmp_path / "charges.xlsx", seed=3)
+    tenants_df = pd.DataFrame({"Appartement": TENANT_CASES["mixte"]})
+    water = {"price_ef": 0.0, "price_ec": 0.0, "price_eu": 0.0}; energy = {"price_pac": 0.0}
+    pd.testing.assert_frame_equal(new_amounts(path, tenants_df, water, energy), old_loop(path, tenants_df, water, energy))
@@ -0,0 +1,60 @@
+"""Regroupement des frais: types communs (_unifier_types) et onglet 'frais divers'."""
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src import frais_excel
+from src.file_io import excel_pool
+from src.frais_excel import _unifier_types
+
+def concat_unifie(frames):
+    return pd.concat(_unifier_types(frames), ignore_index=True)
+
+def test_colonne_entiere_vide_dans_une_feuille():
+    a = pd.DataFrame({"Description": ["x", "y"], "Montant (CHF)": [10, 20]})
+    b = pd.DataFrame({"Description": ["z"], "Montant (CHF)": [np.nan]})
+    out = concat_unifie([a, b])
+    assert out["Montant (CHF)"].dtype == "float64"
+    assert out["Montant (CHF)"].tolist()[:2] == [10.0, 20.0] and pd.isna(out["Montant (CHF)"].iloc[2])
+    pd.testing.assert_frame_equal(out, pd.concat([a, b], ignore_index=True))
+
+def test_colonne_booleenne_vide_dans_une_feuille():
+    a = pd.DataFrame({"Flag": [True, False]})
+    b = pd.DataFrame({"Flag": [np.nan]})
+    out = concat_unifie([a, b])
+    assert out["Flag"].tolist()[:2] == [True, False] and pd.isna(out["Flag"].iloc[2])
+
+def test_colonne_absente_dans_une_feuille():
+    a = pd.DataFrame({"Description": ["x"], "Quantite": [3]})
+    b = pd.DataFrame({"Description": ["y"]})
+    out = concat_unifie([a, b])
+    assert out["Quantite"].dtype == "float64" and out["Quantite"].iloc[0] == 3 and pd.isna(out["Quantite"].iloc[1])
+
+def test_types_conserves_sans_vides():
+    a = pd.DataFrame({"Montant (CHF)": [1, 2], "Flag": [True, False]})
+    b = pd.DataFrame({"Montant (CHF)": [3], "Flag": [True]})
+    out = concat_unifie([a, b])
+    assert out["Montant (CHF)"].dtype == "int64" and out["Flag"].dtype == "bool"
+
+@pytest.fixture
+def classeur(tmp_path, monkeypatch):
+    path = tmp_path / "frais.xlsx"
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        pd.DataFrame({"Description": ["a", "b"], "Montant (CHF)": [100, 250]}).to_excel(w, sheet_name="Entretien", index=False)
+        pd.DataFrame({"Description": ["c"], "Montant (CHF)": [None]}).to_excel(w, sheet_name="Divers", index=False)
+        pd.DataFrame(columns=["Description", "Montant (CHF)", "Groupe"]).to_excel(w, sheet_name="frais divers", index=False)
+    monkeypatch.setattr(frais_excel, "EXCEL_PATH", str(path))
+    yield path
+    excel_pool.invalidate(path)
+
+def test_regroupement_avec_montant_vide(classeur):
+    frais_excel.regrouper_frais_vers_frais_divers()
+    excel_pool.invalidate(classeur)
+    out = pd.read_excel(classeur, sheet_name="frais divers")
+    assert out["Description"].tolist() == ["a", "b", "c"]
+    assert out["Groupe"].tolist() == ["Entretien", "Entretien", "Divers"]
+    assert out["Montant (CHF)"].iloc[:2].tolist() == [100, 250] and pd.isna(out["Montant (CHF)"].iloc[2])